@@ -20,5 +20,12 @@ from . import product_template
 from . import vendor_stock_ept
 from . import account_move
 from . import ir_cron
+from . import ir_module_module
 from . import data_queue_mixin_ept
 from . import account_bank_statement_line
+from . import queue_job_ept
+from . import product_stock_change_ept
+from . import stock_move
+from . import stock_quant
+from . import stock_location
+from . import stock_warehouse
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, api, tools
+
+
+class IrModuleModule(models.Model):
+    _inherit = "ir.module.module"
+
+    @api.model
+    @tools.ormcache('module_name')
+    def is_module_installed_ept(self, module_name):
+        """
+        This method checks whether the given module is installed or not. The result is cached at registry level, so
+        the connectors can use it in the per order and per export loops without searching the modules every time.
+        :param module_name: Technical name of the module.
+        :return: True if the module is installed else False.
+        """
+        return bool(self.sudo().search_count([('name', '=', module_name), ('state', '=', 'installed')]))
+
+    def write(self, vals):
+        """
+        Inherited for clearing the cached installed module flags, when the state of any module is changed by the
+        install, upgrade or uninstall process.
+        """
+        res = super(IrModuleModule, self).write(vals)
+        if 'state' in vals:
+            self.clear_caches()
+        return res
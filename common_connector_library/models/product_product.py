@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 from datetime import datetime
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 
 class ProductProduct(models.Model):
     _inherit = "product.product"
@@ -103,8 +103,7 @@ class ProductProduct(models.Model):
         """
         # Check MRP module is installed or not
         result = []
-        module_obj = self.env['ir.module.module']
-        mrp_module = module_obj.sudo().search([('name', '=', 'mrp'), ('state', '=', 'installed')])
+        mrp_module = self.env['ir.module.module'].is_module_installed_ept('mrp')
         date = str(datetime.strftime(from_datetime, '%Y-%m-%d %H:%M:%S'))
 
         if mrp_module:
@@ -128,74 +127,130 @@ class ProductProduct(models.Model):
 
         return list(set(product_ids))
 
-    def prepare_location_and_product_ids(self, warehouse, product_list):
+    @api.model
+    @tools.ormcache('warehouse_ids')
+    def get_warehouse_location_ids_ept(self, warehouse_ids):
         """
-        This method prepares location and product ids from warehouse and list of product id.
-        @param warehouse: Record of Warehouse
-        @param product_list: Ids of Product.
-        @return: Ids of locations and products in string.
-        @author: Maulik Barad on Date 21-Oct-2020.
+        This method gives the ids of the stock locations of the warehouses, with their child locations. The result is
+        cached at registry level and it is cleared, when any location is created or moved or the stock location
+        of a warehouse is changed.
+        @param warehouse_ids: Tuple of ids of warehouses.
+        @return: Tuple of ids of locations.
         """
-        locations = self.env['stock.location'].search([('location_id', 'child_of', warehouse.lot_stock_id.ids)])
-        location_ids = ','.join(str(e) for e in locations.ids)
-        product_ids = ','.join(str(e) for e in product_list)
-        return location_ids, product_ids
+        self._cr.execute("""SELECT DISTINCT sl.id FROM stock_location sl
+            JOIN stock_location root ON sl.parent_path LIKE root.parent_path || '%%'
+            JOIN stock_warehouse sw ON sw.lot_stock_id = root.id
+            WHERE sw.id = ANY(%s) AND sl.active""", (list(warehouse_ids),))
+        return tuple(row[0] for row in self._cr.fetchall())
 
-    def check_for_bom_products(self, product_ids):
+    def prepare_stock_qty_query(self, include_incoming=False):
         """
-        This method checks if any product is BoM, then get stock for them.
-        @param product_ids: Ids of Product.
-        @return: Ids of BoM products.
-        @author: Maulik Barad on Date 21-Oct-2020.
+        This method prepares query for fetching the free qty of the products in the locations. The incoming qty of
+        the reserved moves is added for the forecasted qty.
+        @param include_incoming: True for the forecasted qty.
+        @return: Query with the product_ids and location_ids parameters.
         """
-        bom_product_ids = []
-        module_obj = self.env['ir.module.module']
-
-        mrp_module = module_obj.sudo().search([('name', '=', 'mrp'), ('state', '=', 'installed')])
-        if mrp_module:
-            qry = ("""select p.id as product_id from product_product as p
-                        inner join mrp_bom as mb on mb.product_tmpl_id=p.product_tmpl_id
-                        and p.id in (%s)"""% product_ids)
-            self._cr.execute(qry)
-            bom_product_ids = self._cr.dictfetchall()
-            bom_product_ids = [product_id.get('product_id') for product_id in bom_product_ids]
-
-        return bom_product_ids
+        query = """SELECT product_id, SUM(stock) FROM (
+                SELECT product_id, quantity - reserved_quantity AS stock FROM stock_quant
+                WHERE product_id = ANY(%(product_ids)s) AND location_id = ANY(%(location_ids)s)"""
+        if include_incoming:
+            query += """
+                UNION ALL
+                SELECT product_id, product_qty AS stock FROM stock_move
+                WHERE state = 'assigned' AND product_id = ANY(%(product_ids)s)
+                AND location_dest_id = ANY(%(location_ids)s)"""
+        query += """) AS stock GROUP BY product_id"""
+        return query
 
-    def prepare_free_qty_query(self, location_ids, simple_product_list_ids):
+    def get_kit_components_ept(self, product_ids, company):
         """
-        This method prepares query for fetching the free qty.
-        @param location_ids:Ids of Locations.
-        @param simple_product_list_ids: Ids of products which are not BoM.
-        @return: Prepared query in string.
-        @author: Maulik Barad on Date 21-Oct-2020.
+        This method gives the storable components of the kit products with the quantity needed for one unit of the
+        kit, in the unit of measure of the products. The BoM is chosen like the MRP does, by sequence first and
+        then the BoM of the variant before the BoM of the template with the same sequence. The BoM lines of other
+        variants are skipped.
+        @param product_ids: Ids of products.
+        @param company: Record of company of the warehouses.
+        @return: Dictionary of kit product id and list of tuples of component id, quantity per kit and True if the
+        component is a kit too.
         """
-        query = """select pp.id as product_id,
-                COALESCE(sum(sq.quantity)-sum(sq.reserved_quantity),0) as stock
-                from product_product pp
-                left join stock_quant sq on pp.id = sq.product_id and sq.location_id in (%s)
-                where pp.id in (%s) group by pp.id;""" % (location_ids, simple_product_list_ids)
-        return query
+        kit_components = {}
+        if not product_ids or not self.env['ir.module.module'].is_module_installed_ept('mrp'):
+            return kit_components
+
+        self._cr.execute("""WITH kit AS (
+                SELECT DISTINCT ON (pp.id) pp.id AS product_id, mb.id AS bom_id FROM product_product pp
+                JOIN mrp_bom mb ON mb.product_tmpl_id = pp.product_tmpl_id
+                    AND (mb.product_id IS NULL OR mb.product_id = pp.id)
+                WHERE pp.id = ANY(%(product_ids)s) AND mb.type = 'phantom' AND mb.active
+                    AND (mb.company_id IS NULL OR mb.company_id = %(company_id)s)
+                ORDER BY pp.id, mb.sequence, mb.product_id, mb.id)
+            SELECT kit.product_id, ml.product_id,
+                (ml.product_qty / line_uom.factor * component_uom.factor) /
+                    NULLIF(mb.product_qty / bom_uom.factor * kit_uom.factor, 0),
+                EXISTS(SELECT 1 FROM mrp_bom cb WHERE cb.product_tmpl_id = component.product_tmpl_id
+                       AND (cb.product_id IS NULL OR cb.product_id = component.id) AND cb.type = 'phantom'
+                       AND cb.active)
+            FROM kit
+            JOIN mrp_bom mb ON mb.id = kit.bom_id
+            JOIN mrp_bom_line ml ON ml.bom_id = mb.id
+            JOIN product_product component ON component.id = ml.product_id
+            JOIN product_template component_tmpl ON component_tmpl.id = component.product_tmpl_id
+            JOIN product_product kit_product ON kit_product.id = kit.product_id
+            JOIN product_template kit_tmpl ON kit_tmpl.id = kit_product.product_tmpl_id
+            JOIN uom_uom line_uom ON line_uom.id = ml.product_uom_id
+            JOIN uom_uom component_uom ON component_uom.id = component_tmpl.uom_id
+            JOIN uom_uom bom_uom ON bom_uom.id = mb.product_uom_id
+            JOIN uom_uom kit_uom ON kit_uom.id = kit_tmpl.uom_id
+            WHERE component_tmpl.type = 'product' AND ml.product_qty > 0
+                AND (NOT EXISTS(SELECT 1 FROM mrp_bom_line_product_template_attribute_value_rel rel
+                                WHERE rel.mrp_bom_line_id = ml.id)
+                     OR EXISTS(SELECT 1 FROM mrp_bom_line_product_template_attribute_value_rel rel
+                               JOIN product_variant_combination pvc
+                                   ON pvc.product_template_attribute_value_id = rel.product_template_attribute_value_id
+                               WHERE rel.mrp_bom_line_id = ml.id AND pvc.product_product_id = kit.product_id))""",
+                         {'product_ids': list(product_ids), 'company_id': company.id})
+        for kit_id, component_id, qty_per_kit, is_kit in self._cr.fetchall():
+            if qty_per_kit:
+                kit_components.setdefault(kit_id, []).append((component_id, qty_per_kit, is_kit))
+        return kit_components
 
-    def prepare_forecasted_qty_query(self, location_ids, simple_product_list_ids):
+    def get_stock_qty_ept(self, warehouse, product_list, include_incoming=False):
         """
-        This method prepares query for fetching the forecasted qty.
-        @param location_ids:Ids of Locations.
-        @param simple_product_list_ids: Ids of products which are not BoM.
-        @return: Prepared query in string.
-        @author: Maulik Barad on Date 21-Oct-2020.
+        This method gives the stock of the products in the warehouses in a few queries. The stock of a kit is the
+        number of complete kits, which can be made from the stock of its components. Kits having other kits as
+        components are computed by the ORM.
+        @param warehouse: Records of warehouses.
+        @param product_list: List of product ids.
+        @param include_incoming: True for the forecasted qty.
+        @return: Dictionary as product_id : qty.
         """
-        query = ("""select product_id,sum(stock) as stock from (select pp.id as product_id,
-                COALESCE(sum(sq.quantity)-sum(sq.reserved_quantity),0) as stock
-                from product_product pp
-                left join stock_quant sq on pp.id = sq.product_id and sq.location_id in (%s)
-                where pp.id in (%s) group by pp.id
-                union all
-                select product_id as product_id, sum(product_qty) as stock from stock_move
-                where state in ('assigned') and product_id in (%s) and location_dest_id in (%s)
-                group by product_id) as test group by test.product_id"""%(location_ids, simple_product_list_ids,
-                 simple_product_list_ids, location_ids))
-        return query
+        if not product_list:
+            return {}
+        location_ids = self.get_warehouse_location_ids_ept(tuple(sorted(warehouse.ids)))
+        kit_components = self.get_kit_components_ept(product_list, warehouse.company_id[:1])
+        nested_kit_ids = [kit_id for kit_id, components in kit_components.items() if
+                          any(is_kit for _component_id, _qty, is_kit in components)]
+
+        product_ids = set(product_list) - set(kit_components)
+        for kit_id, components in kit_components.items():
+            product_ids.update(component_id for component_id, _qty, _is_kit in components)
+
+        self._cr.execute(self.prepare_stock_qty_query(include_incoming),
+                         {'product_ids': list(product_ids), 'location_ids': list(location_ids)})
+        stock = dict(self._cr.fetchall())
+
+        product_stock = {}
+        for product_id in product_list:
+            components = kit_components.get(product_id)
+            if components is None:
+                product_stock[product_id] = stock.get(product_id, 0)
+            elif product_id not in nested_kit_ids:
+                product_stock[product_id] = min(
+                    stock.get(component_id, 0) / qty_per_kit for component_id, qty_per_kit, _is_kit in components) // 1
+
+        for product in self.with_context(warehouse=warehouse.ids).browse(nested_kit_ids):
+            product_stock[product.id] = product.free_qty + (product.incoming_qty if include_incoming else 0)
+        return product_stock
 
     def get_free_qty_ept(self, warehouse, product_list):
         """
@@ -206,25 +261,7 @@ class ProductProduct(models.Model):
         :return: Dictionary as product_id : on_hand_qty
         Migration done by twinkalc August 2020
         """
-        qty_on_hand = {}
-        location_ids, product_ids = self.prepare_location_and_product_ids(warehouse, product_list)
-
-        bom_product_ids = self.check_for_bom_products(product_ids)
-        if bom_product_ids:
-            bom_products = self.with_context(warehouse=warehouse.ids).browse(bom_product_ids)
-            for product in bom_products:
-                actual_stock = getattr(product, 'free_qty')
-                qty_on_hand.update({product.id:actual_stock})
-
-        simple_product_list = list(set(product_list) - set(bom_product_ids))
-        simple_product_list_ids = ','.join(str(e) for e in simple_product_list)
-        if simple_product_list_ids:
-            qry = self.prepare_free_qty_query(location_ids, simple_product_list_ids)
-            self._cr.execute(qry)
-            result = self._cr.dictfetchall()
-            for i in result:
-                qty_on_hand.update({i.get('product_id'):i.get('stock')})
-        return qty_on_hand
+        return self.get_stock_qty_ept(warehouse, product_list)
 
     def get_forecasted_qty_ept(self, warehouse, product_list):
         """
@@ -235,22 +272,4 @@ class ProductProduct(models.Model):
         :return: Forecasted Quantity
         Migration done by twinkalc August 2020
         """
-        forcasted_qty = {}
-        location_ids, product_ids = self.prepare_location_and_product_ids(warehouse, product_list)
-
-        bom_product_ids = self.check_for_bom_products(product_ids)
-        if bom_product_ids:
-            bom_products = self.with_context(warehouse=warehouse.ids).browse(bom_product_ids)
-            for product in bom_products:
-                actual_stock = getattr(product, 'free_qty') + getattr(product, 'incoming_qty')
-                forcasted_qty.update({product.id:actual_stock})
-
-        simple_product_list = list(set(product_list) - set(bom_product_ids))
-        simple_product_list_ids = ','.join(str(e) for e in simple_product_list)
-        if simple_product_list_ids:
-            qry = self.prepare_forecasted_qty_query(location_ids, simple_product_list_ids)
-            self._cr.execute(qry)
-            result = self._cr.dictfetchall()
-            for i in result:
-                forcasted_qty.update({i.get('product_id'):i.get('stock')})
-        return forcasted_qty
+        return self.get_stock_qty_ept(warehouse, product_list, include_incoming=True)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+""" Products of which the stock is changed, kept for each connector, which exports only those products."""
+from datetime import datetime, timedelta
+
+from odoo import models, fields, api
+
+# Changes older than this are removed. A connector which did not export for longer scans the stock moves instead.
+STOCK_CHANGE_RETENTION_DAYS = 7
+
+
+class ProductStockChangeEpt(models.Model):
+    """ Stock changes waiting for the export of each connector. The stock operations only insert the rows, so they
+    never wait for each other on this table, and the exporter removes the rows it has exported. A row is visible to
+    the exporter only when the stock operation is committed, so no change is missed however long the operation
+    runs."""
+    _name = "product.stock.change.ept"
+    _description = "Product Stock Change"
+    _log_access = False
+
+    product_id = fields.Many2one("product.product", required=True, ondelete="cascade")
+    company_id = fields.Many2one("res.company", ondelete="cascade")
+    consumer_key = fields.Char(required=True, index=True, help="Key of the connector, which exports the change.")
+    changed_at = fields.Datetime(required=True, index=True)
+
+    @api.model
+    def mark_products_changed_ept(self, product_ids, company_id=False, consumer_keys=None, notify=True):
+        """
+        Usage: Adds the stock change of the products for each connector of the company in one query and notifies
+        the connectors.
+        :param product_ids: Ids of the products.
+        :param company_id: Id of the company of the stock.
+        :param consumer_keys: Keys of the connectors. All the connectors of the company when not given.
+        :param notify: False to not notify the connectors, e.g. when the failed exports are added again.
+        :return: True
+        """
+        if consumer_keys is None:
+            consumer_keys = self.get_stock_change_consumers_ept(company_id)
+        if not product_ids or not consumer_keys:
+            return True
+        self._cr.execute("""INSERT INTO product_stock_change_ept (product_id, company_id, consumer_key, changed_at)
+            SELECT product_id, %s, consumer_key, now() at time zone 'UTC'
+            FROM unnest(%s) AS product_id, unnest(%s) AS consumer_key""",
+                         (company_id or None, list(set(product_ids)), list(consumer_keys)))
+        if notify:
+            self.notify_stock_change_ept(company_id)
+        return True
+
+    @api.model
+    def get_stock_change_consumers_ept(self, company_id):
+        """
+        Usage: Hook for the connectors to give their keys, which export the stock of the company.
+        :param company_id: Id of the company of the stock. False for the stock without company.
+        :return: List of keys.
+        """
+        return []
+
+    @api.model
+    def notify_stock_change_ept(self, company_id):
+        """
+        Usage: Hook for the connectors to start the stock export, when the stock of the company is changed.
+        :param company_id: Id of the company of the stock.
+        :return: True
+        """
+        return True
+
+    @api.model
+    def get_changed_products_ept(self, consumer_key, from_datetime, company=False):
+        """
+        Usage: Gives the products of which the stock is changed for the connector, with the kits of those products,
+        and the changes to remove once those are exported. When the last export is older than the kept changes, the
+        stock moves are scanned instead.
+        :param consumer_key: Key of the connector.
+        :param from_datetime: Date of the last export.
+        :param company: Record of Company.
+        :return: List of product ids, list of ids of changes.
+        """
+        self._cr.execute("SELECT id, product_id FROM product_stock_change_ept WHERE consumer_key = %s",
+                         (consumer_key,))
+        changes = self._cr.fetchall()
+        change_ids = [change_id for change_id, _product_id in changes]
+
+        if from_datetime < datetime.now() - timedelta(days=STOCK_CHANGE_RETENTION_DAYS):
+            product_ids = self.env["product.product"].get_products_based_on_movement_date_ept(from_datetime, company)
+            return product_ids, change_ids
+
+        product_ids = list({product_id for _change_id, product_id in changes})
+        if product_ids and self.env["ir.module.module"].is_module_installed_ept("mrp"):
+            self._cr.execute("""SELECT DISTINCT p.id FROM product_product p
+                JOIN mrp_bom mb ON mb.product_tmpl_id = p.product_tmpl_id
+                JOIN mrp_bom_line ml ON ml.bom_id = mb.id
+                WHERE ml.product_id = ANY(%s)""", (product_ids,))
+            product_ids = list(set(product_ids + [row[0] for row in self._cr.fetchall()]))
+        return product_ids, change_ids
+
+    @api.model
+    def consume_stock_changes_ept(self, change_ids):
+        """
+        Usage: Removes the changes, which are exported. The changes added meanwhile have other ids, so those are
+        kept for the next export.
+        :param change_ids: Ids of changes.
+        :return: True
+        """
+        if change_ids:
+            self._cr.execute("DELETE FROM product_stock_change_ept WHERE id = ANY(%s)", (change_ids,))
+        return True
+
+    @api.model
+    def delete_old_stock_changes_ept(self):
+        """
+        Usage: Removes the stock changes, which are older than the kept changes, e.g. of a connector whose export is
+        stopped. It is called from the cron.
+        :return: True
+        """
+        self._cr.execute("DELETE FROM product_stock_change_ept WHERE changed_at < %s",
+                         (datetime.now() - timedelta(days=STOCK_CHANGE_RETENTION_DAYS),))
+        return True
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+""" Durable jobs to process the connector queues without waiting for the queue crons."""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger("Connector Queue Job")
+
+# Namespace of the advisory locks, which the runners keep on their running jobs.
+QUEUE_JOB_LOCK_NAMESPACE = 7312
+# Methods, which the jobs are allowed to call.
+QUEUE_JOB_ALLOWED_METHODS = ["process_queue_job_ept"]
+
+
+class QueueJobEpt(models.Model):
+    """ Job to call a method of a record in the background, with retries and dead-letter."""
+    _name = "common.queue.job.ept"
+    _description = "Connector Queue Job"
+    _order = "priority desc, id"
+
+    name = fields.Char()
+    job_type = fields.Char(index=True, help="Type of the job, like the model and the method it calls.")
+    res_model = fields.Char(required=True)
+    res_id = fields.Integer(required=True, index=True)
+    method_name = fields.Char(required=True)
+    priority = fields.Integer(default=1, help="Jobs with higher priority run first.")
+    state = fields.Selection([("pending", "Pending"), ("running", "Running"), ("done", "Done"),
+                              ("dead", "Dead")], default="pending", index=True)
+    shop_key = fields.Char(index=True, help="Jobs with the same key share the concurrency limit.")
+    shop_concurrency = fields.Integer(help="Maximum running jobs of the same key. Zero means no limit.")
+    attempt_count = fields.Integer()
+    max_attempts = fields.Integer(default=5)
+    next_attempt_at = fields.Datetime(index=True)
+    date_started = fields.Datetime()
+    date_done = fields.Datetime()
+    error_message = fields.Text()
+
+    @api.model
+    def enqueue_job_ept(self, record, method_name, priority=1, shop_key=False, shop_concurrency=0):
+        """
+        Usage: Creates the job to call the method of the record, when no job is pending for it, and wakes up the
+        job runner. The runner is notified by the cron trigger, which is sent on commit. The jobs are run by the
+        superuser, so only this method creates them, without giving the users access to the jobs.
+        :param record: Record on which the method is called.
+        :param method_name: Name of the method.
+        :param priority: Jobs with higher priority run first.
+        :param shop_key: Key of the shop, to limit the running jobs of the same shop.
+        :param shop_concurrency: Maximum running jobs of the shop.
+        :return: Record of job.
+        """
+        queue_job_obj = self.sudo()
+        job = queue_job_obj.search([("res_model", "=", record._name), ("res_id", "=", record.id),
+                                    ("method_name", "=", method_name), ("state", "=", "pending")], limit=1)
+        if not job:
+            job = queue_job_obj.create({"name": "%s(%s).%s" % (record._name, record.id, method_name),
+                                        "job_type": "%s.%s" % (record._name, method_name),
+                                        "res_model": record._name,
+                                        "res_id": record.id,
+                                        "method_name": method_name,
+                                        "priority": priority,
+                                        "shop_key": shop_key,
+                                        "shop_concurrency": shop_concurrency})
+        runner_cron = self.env.ref("common_connector_library.ir_cron_run_queue_jobs_ept", False)
+        if runner_cron:
+            runner_cron.sudo()._trigger()
+        return job
+
+    @api.model
+    def run_queue_jobs_ept(self, time_limit=50):
+        """
+        Usage: Runs the pending jobs one by one until no job is left or the time is over. It is called by the job
+        runner cron. The jobs are claimed with SKIP LOCKED, so more runners can work on the same jobs.
+        :param time_limit: Seconds to run the jobs.
+        :return: True
+        """
+        start = time.time()
+        self.requeue_stale_jobs_ept()
+        while time.time() - start < time_limit:
+            job = self.claim_next_job_ept()
+            if not job:
+                break
+            job.execute_job_ept()
+        return True
+
+    def requeue_stale_jobs_ept(self):
+        """
+        Usage: Finds the running jobs, whose runner is gone. The runner keeps a session advisory lock on its job,
+        which is released when its database connection is closed, so a running job without the lock has lost its
+        worker, e.g. by a timeout or out of memory. Such jobs are counted as a failed attempt, so a job killing its
+        worker ends as dead instead of looping.
+        :return: True
+        """
+        self._cr.execute("""SELECT id FROM common_queue_job_ept WHERE state = 'running' FOR UPDATE SKIP LOCKED""")
+        stale_jobs = self.browse()
+        for job_id in [row[0] for row in self._cr.fetchall()]:
+            self._cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (QUEUE_JOB_LOCK_NAMESPACE, job_id))
+            if self._cr.fetchone()[0]:
+                self._cr.execute("SELECT pg_advisory_unlock(%s, %s)", (QUEUE_JOB_LOCK_NAMESPACE, job_id))
+                stale_jobs |= self.browse(job_id)
+        for job in stale_jobs:
+            job.set_job_failed_ept("The worker running the job was stopped.")
+        self._cr.commit()
+        return True
+
+    def claim_next_job_ept(self):
+        """
+        Usage: Takes the pending job with the highest priority, whose shop has not reached its concurrency limit,
+        and marks it as running. The advisory lock of the job is taken before the job is committed as running, and
+        it is kept until the job is finished.
+        :return: Record of job or False.
+        """
+        self._cr.execute("""SELECT job.id FROM common_queue_job_ept AS job
+            WHERE job.state = 'pending'
+            AND (job.next_attempt_at IS NULL OR job.next_attempt_at <= (now() at time zone 'UTC'))
+            AND (job.shop_key IS NULL OR coalesce(job.shop_concurrency, 0) <= 0 OR
+                 (SELECT count(*) FROM common_queue_job_ept AS running_job
+                  WHERE running_job.state = 'running' AND running_job.shop_key = job.shop_key)
+                 < job.shop_concurrency)
+            ORDER BY job.priority DESC, job.id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED""")
+        result = self._cr.fetchone()
+        if not result:
+            return False
+        self._cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (QUEUE_JOB_LOCK_NAMESPACE, result[0]))
+        if not self._cr.fetchone()[0]:
+            return False
+        job = self.browse(result[0])
+        job.write({"state": "running", "date_started": datetime.now()})
+        self._cr.commit()
+        return job
+
+    def execute_job_ept(self):
+        """
+        Usage: Calls the method of the job. When it fails, the job is retried with exponential backoff, and after
+        the last attempt it is marked as dead and the record is informed by its queue_job_dead_ept method. A job
+        calling a private method or a method out of the allowed methods is marked as dead without calling it.
+        :return: True
+        """
+        self.ensure_one()
+        if self.method_name.startswith("_") or self.method_name not in self.get_allowed_job_methods_ept() or \
+                self.res_model not in self.env:
+            _logger.warning("Job %s calls a method, which is not allowed.", self.name)
+            self.write({"state": "dead", "error_message": "The method %s of %s is not allowed to be called by a "
+                                                          "job." % (self.method_name, self.res_model)})
+            self._cr.commit()
+            self._cr.execute("SELECT pg_advisory_unlock(%s, %s)", (QUEUE_JOB_LOCK_NAMESPACE, self.id))
+            return False
+        record = self.env[self.res_model].browse(self.res_id).exists()
+        try:
+            if record:
+                getattr(record, self.method_name)()
+            self.write({"state": "done", "date_done": datetime.now(), "error_message": False})
+            self._cr.commit()
+        except Exception as error:
+            self._cr.rollback()
+            _logger.exception("Job %s failed.", self.name)
+            self.set_job_failed_ept(str(error))
+            self._cr.commit()
+        finally:
+            self._cr.execute("SELECT pg_advisory_unlock(%s, %s)", (QUEUE_JOB_LOCK_NAMESPACE, self.id))
+        return True
+
+    @api.model
+    def get_allowed_job_methods_ept(self):
+        """
+        Usage: Gives the methods, which the jobs are allowed to call. The connectors can extend it for their jobs.
+        :return: List of method names.
+        """
+        return list(QUEUE_JOB_ALLOWED_METHODS)
+
+    def set_job_failed_ept(self, message):
+        """
+        Usage: Counts the failed attempt of the job. The job is retried with exponential backoff, and after the last
+        attempt it is marked as dead and the record is informed by its queue_job_dead_ept method.
+        :param message: Error of the attempt.
+        :return: True
+        """
+        attempt_count = self.attempt_count + 1
+        if attempt_count >= self.max_attempts:
+            self.write({"state": "dead", "attempt_count": attempt_count, "error_message": message})
+            record = self.env[self.res_model].browse(self.res_id).exists()
+            if hasattr(record, "queue_job_dead_ept"):
+                record.queue_job_dead_ept(message)
+        else:
+            self.write({"state": "pending", "attempt_count": attempt_count, "error_message": message,
+                        "next_attempt_at": datetime.now() + timedelta(seconds=30 * 2 ** attempt_count)})
+        return True
+
+    def has_active_job_ept(self, record):
+        """
+        Usage: Checks whether a job of the record is pending or running.
+        :param record: Record of the job.
+        :return: True or False.
+        """
+        return bool(self.sudo().search_count([("res_model", "=", record._name), ("res_id", "=", record.id),
+                                              ("state", "in", ["pending", "running"])]))
@@ -265,7 +265,23 @@ class SaleOrder(models.Model):
         :param is_mrp_installed: It is a boolean for mrp installed or not.
         :return: This method will generate stock move and done it, it will return boolean.
         Migration done by twinkalc August 2020
+        Moves of all the orders in self are now created with one create and validated with one _action_done.
         """
+        move_vals_list = []
+        for order in self:
+            move_vals_list += order.prepare_auto_shipped_move_vals_ept(customers_location, is_mrp_installed)
+        self.create_and_done_stock_moves_ept(move_vals_list)
+        return True
+
+    def prepare_auto_shipped_move_vals_ept(self, customers_location, is_mrp_installed=False):
+        """
+        This method prepares the vals of the auto processed stock moves for the order lines of the order.
+        :param customers_location: It is customer location object.
+        :param is_mrp_installed: It is a boolean for mrp installed or not.
+        :return: List of dictionaries of stock move vals.
+        """
+        self.ensure_one()
+        move_vals_list = []
         order_lines = self.order_line.filtered(lambda l: l.product_id.type != 'service')
         vendor_location = self.env['stock.location'].search(['|', ('company_id', '=', self.company_id.id),
                                                              ('company_id', '=', False), ('usage', '=', 'supplier')],
@@ -275,12 +291,14 @@ class SaleOrder(models.Model):
             if is_mrp_installed:
                 bom_lines = self.check_for_bom_product(order_line.product_id)
             for bom_line in bom_lines:
-                self.create_and_done_stock_move_ept(order_line, customers_location, bom_line=bom_line)
+                move_vals_list.append(self.prepare_auto_processed_move_vals_ept(order_line, customers_location,
+                                                                                bom_line=bom_line))
             if not bom_lines and order_line.product_id.is_drop_ship_product:
-                self.create_and_done_stock_move_ept(order_line, customers_location, vendor_location=vendor_location)
+                move_vals_list.append(self.prepare_auto_processed_move_vals_ept(order_line, customers_location,
+                                                                                vendor_location=vendor_location))
             elif not bom_lines or not is_mrp_installed:
-                self.create_and_done_stock_move_ept(order_line, customers_location)
-        return True
+                move_vals_list.append(self.prepare_auto_processed_move_vals_ept(order_line, customers_location))
+        return [vals for vals in move_vals_list if vals]
 
     def check_for_bom_product(self, product):
         """
@@ -300,14 +318,15 @@ class SaleOrder(models.Model):
         except:
             return {}
 
-    def create_and_done_stock_move_ept(self, order_line, customers_location, bom_line=False, vendor_location=False):
+    def prepare_auto_processed_move_vals_ept(self, order_line, customers_location, bom_line=False,
+                                             vendor_location=False):
         """
-        Added by Udit
-        It will create and done stock move as per the data in order line.
-        Migration done by twinkalc August 2020
-        @param customers_location: Customer type location.
+        This method prepares the vals of an auto processed stock move as per the data in order line.
         @param order_line: Record of sale order line.
-        @param bom_line:
+        @param customers_location: Customer type location.
+        @param bom_line: Exploded BoM line, when the move is for a kit component.
+        @param vendor_location: Vendor location, when the product is dropshipped.
+        @return: Dictionary of stock move vals or empty dictionary, when there is nothing to move.
         """
         if bom_line:
             product = bom_line[0].product_id
@@ -318,22 +337,49 @@ class SaleOrder(models.Model):
             product_qty = order_line.product_uom_qty
             product_uom = order_line.product_uom
 
-        if product and product_qty and product_uom:
-            vals = {
-                'name': _('Auto processed move : %s') %product.display_name,
-                'company_id': self.company_id.id,
-                'product_id': product.id if product else False,
-                'product_uom_qty': product_qty,
-                'product_uom': product_uom.id if product_uom else False,
-                'location_id': vendor_location.id if vendor_location else self.warehouse_id.lot_stock_id.id,
-                'location_dest_id': customers_location.id,
-                'state': 'confirmed',
-                'sale_line_id': order_line.id
-            }
-            if bom_line:
-                vals.update({'bom_line_id': bom_line[0].id})
-            stock_move = self.env['stock.move'].create(vals)
-            stock_move._action_assign()
-            stock_move._set_quantity_done(product_qty)
-            stock_move._action_done()
+        if not (product and product_qty and product_uom):
+            return {}
+        vals = {
+            'name': _('Auto processed move : %s') % product.display_name,
+            'company_id': self.company_id.id,
+            'product_id': product.id if product else False,
+            'product_uom_qty': product_qty,
+            'product_uom': product_uom.id if product_uom else False,
+            'location_id': vendor_location.id if vendor_location else self.warehouse_id.lot_stock_id.id,
+            'location_dest_id': customers_location.id,
+            'state': 'confirmed',
+            'sale_line_id': order_line.id
+        }
+        if bom_line:
+            vals.update({'bom_line_id': bom_line[0].id})
+        return vals
+
+    def create_and_done_stock_moves_ept(self, move_vals_list):
+        """
+        This method creates all the auto processed stock moves at once and validates them together.
+        @param move_vals_list: List of dictionaries of stock move vals.
+        @return: Records of created stock moves.
+        """
+        stock_moves = self.env['stock.move']
+        if not move_vals_list:
+            return stock_moves
+        stock_moves = stock_moves.create(move_vals_list)
+        stock_moves._action_assign()
+        for stock_move in stock_moves:
+            stock_move._set_quantity_done(stock_move.product_uom_qty)
+        stock_moves._action_done()
+        return stock_moves
+
+    def create_and_done_stock_move_ept(self, order_line, customers_location, bom_line=False, vendor_location=False):
+        """
+        Added by Udit
+        It will create and done stock move as per the data in order line.
+        Migration done by twinkalc August 2020
+        @param customers_location: Customer type location.
+        @param order_line: Record of sale order line.
+        @param bom_line:
+        """
+        vals = self.prepare_auto_processed_move_vals_ept(order_line, customers_location, bom_line=bom_line,
+                                                         vendor_location=vendor_location)
+        self.create_and_done_stock_moves_ept([vals] if vals else [])
         return True
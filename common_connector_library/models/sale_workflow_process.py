@@ -101,14 +101,13 @@ class SaleWorkflowProcess(models.Model):
         module_obj = self.env['ir.module.module']
         stock_location_obj = self.env["stock.location"]
 
-        mrp_module = module_obj.sudo().search([('name', '=', 'mrp'), ('state', '=', 'installed')])
+        mrp_module = module_obj.is_module_installed_ept('mrp')
         customer_location = stock_location_obj.search([("usage", "=", "customer")], limit=1)
 
         shipped_orders = orders.filtered(lambda x: x.order_line)
 
-        for order in shipped_orders:
-            order.state = 'sale'
-            order.auto_shipped_order_ept(customer_location, mrp_module)
+        shipped_orders.write({'state': 'sale'})
+        shipped_orders.auto_shipped_order_ept(customer_location, mrp_module)
 
         shipped_orders.validate_and_paid_invoices_ept(self)
         return True
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, api
+
+
+class StockLocation(models.Model):
+    _inherit = "stock.location"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited for clearing the cached locations of the warehouses, used while computing the stock to export.
+        """
+        locations = super(StockLocation, self).create(vals_list)
+        self.clear_caches()
+        return locations
+
+    def write(self, vals):
+        """
+        Inherited for clearing the cached locations of the warehouses, when any location is moved or archived.
+        """
+        res = super(StockLocation, self).write(vals)
+        if 'location_id' in vals or 'active' in vals:
+            self.clear_caches()
+        return res
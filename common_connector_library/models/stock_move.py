@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models
+
+
+class StockMove(models.Model):
+    """ Logs the stock change of the moved products, so the connectors export the stock of only those products."""
+    _inherit = "stock.move"
+
+    def _action_confirm(self, merge=True, merge_into=False):
+        moves = super(StockMove, self)._action_confirm(merge=merge, merge_into=merge_into)
+        moves.mark_stock_changed_ept()
+        return moves
+
+    def _action_assign(self):
+        result = super(StockMove, self.with_context(stock_change_logged_ept=True))._action_assign()
+        self.mark_stock_changed_ept()
+        return result
+
+    def _do_unreserve(self):
+        result = super(StockMove, self.with_context(stock_change_logged_ept=True))._do_unreserve()
+        self.mark_stock_changed_ept()
+        return result
+
+    def _action_done(self, cancel_backorder=False):
+        moves = super(StockMove, self.with_context(stock_change_logged_ept=True))._action_done(
+            cancel_backorder=cancel_backorder)
+        (self.exists() | moves).mark_stock_changed_ept()
+        return moves.with_context(self._context)
+
+    def _action_cancel(self):
+        result = super(StockMove, self)._action_cancel()
+        self.mark_stock_changed_ept()
+        return result
+
+    def mark_stock_changed_ept(self):
+        """
+        Usage: Logs the stock change of the storable products of the moves, company wise.
+        :return: True
+        """
+        stock_change_obj = self.env["product.stock.change.ept"]
+        moves = self.filtered(lambda move: move.product_id.type == "product")
+        for company in moves.company_id:
+            stock_change_obj.mark_products_changed_ept(
+                moves.filtered(lambda move: move.company_id == company).product_id.ids, company.id)
+        return True
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, api
+
+
+class StockQuant(models.Model):
+    """ Logs the stock change of the quants, which are updated outside of the stock moves."""
+    _inherit = "stock.quant"
+
+    @api.model
+    def _update_available_quantity(self, product_id, location_id, quantity, *args, **kwargs):
+        result = super(StockQuant, self)._update_available_quantity(product_id, location_id, quantity, *args,
+                                                                    **kwargs)
+        self.mark_quant_changed_ept(product_id, location_id)
+        return result
+
+    @api.model
+    def _update_reserved_quantity(self, product_id, location_id, quantity, *args, **kwargs):
+        result = super(StockQuant, self)._update_reserved_quantity(product_id, location_id, quantity, *args,
+                                                                   **kwargs)
+        self.mark_quant_changed_ept(product_id, location_id)
+        return result
+
+    @api.model
+    def mark_quant_changed_ept(self, product, location):
+        """
+        Usage: Logs the stock change of the product, when it is not logged by the stock move.
+        :param product: Record of product.
+        :param location: Record of location.
+        :return: True
+        """
+        if self._context.get("stock_change_logged_ept") or location.usage not in ("internal", "transit"):
+            return True
+        return self.env["product.stock.change.ept"].mark_products_changed_ept(product.ids, location.company_id.id)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models
+
+
+class StockWarehouse(models.Model):
+    _inherit = "stock.warehouse"
+
+    def write(self, vals):
+        """
+        Inherited for clearing the cached locations of the warehouses, when the stock location of any warehouse is
+        changed.
+        """
+        res = super(StockWarehouse, self).write(vals)
+        if 'lot_stock_id' in vals:
+            self.clear_caches()
+        return res
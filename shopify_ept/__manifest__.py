@@ -33,6 +33,7 @@
         'view/payment_gateway_view.xml',
         'wizard/queue_process_wizard_view.xml',
         'view/order_data_queue_ept.xml',
+        'view/order_backfill_ept.xml',
         'view/product_data_queue_view.xml',
         'view/customer_data_queue_ept.xml',
         'view/location_ept.xml',
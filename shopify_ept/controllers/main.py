@@ -2,11 +2,17 @@
 # See LICENSE file for full copyright and licensing details.
 
 import logging
+import threading
 from odoo import http
 from odoo.http import request
+from ..shopify.session import Session
 
 _logger = logging.getLogger("Shopify Controller")
 
+# Count of rejected webhook requests of this worker by reason.
+webhook_rejection_counts = {"unknown_shop": 0, "invalid_hmac": 0}
+_rejection_lock = threading.Lock()
+
 class Main(http.Controller):
 
     @http.route(['/shopify_odoo_webhook_for_product_update', '/shopify_odoo_webhook_for_product_delete'], csrf=False,
@@ -20,23 +26,7 @@ class Main(http.Controller):
         webhook_route = request.httprequest.path.split('/')[1]  # Here we receive two type of route
         # 1) Update and create product (shopify_odoo_webhook_for_product_update)
         # 2) Delete product (shopify_odoo_webhook_for_product_delete)
-
-        res, instance = self.get_basic_info(webhook_route)
-
-        if not res:
-            return
-
-        _logger.info("%s call for product: %s", webhook_route, res.get("title"))
-
-        shopify_template = request.env["shopify.product.template.ept"].sudo().with_context(active_test=False).search(
-            [("shopify_tmpl_id", "=", res.get("id")), ("shopify_instance_id", "=", instance.id)], limit=1)
-
-        if webhook_route == 'shopify_odoo_webhook_for_product_update' and shopify_template or res.get("published_at"):
-            request.env["shopify.product.data.queue.ept"].sudo().create_shopify_product_queue_from_webhook(res,
-                                                                                                           instance)
-
-        if webhook_route == 'shopify_odoo_webhook_for_product_delete' and shopify_template:
-            shopify_template.write({"active":False})
+        self.store_webhook_request(webhook_route)
         return
 
     @http.route(['/shopify_odoo_webhook_for_customer_create', '/shopify_odoo_webhook_for_customer_update'], csrf=False,
@@ -50,24 +40,9 @@ class Main(http.Controller):
         webhook_route = request.httprequest.path.split('/')[1]  # Here we receive two type of route
         # 1) Create Customer (shopify_odoo_webhook_for_customer_create)
         # 2) Update Customer(shopify_odoo_webhook_for_customer_update)
-
-        res, instance = self.get_basic_info(webhook_route)
-        if not res:
-            return
-
-        _logger.info("%s call for Customer: %s", webhook_route, (res.get("first_name") + " " + res.get("last_name")))
-        self.customer_webhook_process(res, instance)
+        self.store_webhook_request(webhook_route)
         return
 
-    def customer_webhook_process(self, response, instance):
-        """
-        This method used for call child method of customer create process.
-        @author: Maulik Barad on Date 23-Sep-2020.
-        """
-        process_import_export_model = request.env["shopify.process.import.export"].sudo()
-        process_import_export_model.webhook_customer_create_process(response, instance)
-        return True
-
     @http.route("/shopify_odoo_webhook_for_orders_partially_updated", csrf=False, auth="public", type="json")
     def order_create_or_update_webhook(self):
         """
@@ -75,40 +50,54 @@ class Main(http.Controller):
         or update in the Shopify store.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 13-Jan-2020.
         """
-        res, instance = self.get_basic_info("shopify_odoo_webhook_for_orders_partially_updated")
-        if not res:
-            return
-
-        _logger.info("UPDATE ORDER WEBHOOK call for order: %s", res.get("name"))
-
-        fulfillment_status = res.get("fulfillment_status") or "unfulfilled"
-        if request.env["sale.order"].sudo().search_read([("shopify_instance_id", "=", instance.id),
-                                                         ("shopify_order_id", "=", res.get("id")),
-                                                         ("shopify_order_number", "=",
-                                                          res.get("order_number"))],
-                                                        ["id"]):
-            request.env["sale.order"].sudo().process_shopify_order_via_webhook(res, instance, True)
-        elif fulfillment_status in ["fulfilled", "unfulfilled", "partial"]:
-            res["fulfillment_status"] = fulfillment_status
-            request.env["sale.order"].sudo().process_shopify_order_via_webhook(res, instance)
+        self.store_webhook_request("shopify_odoo_webhook_for_orders_partially_updated")
         return
 
-    def get_basic_info(self, route):
+    def store_webhook_request(self, route):
         """
-        This method is used to check that instance and webhook are active or not. If yes then return response and
-        instance, If no then return response as False and instance.
-        @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 10-Jan-2020..
+        This method stores the raw request in the webhook inbox and returns, so Shopify gets the response
+        immediately. The inbox is processed by the cron. Duplicate requests are not stored.
+        @param route: Route of the webhook.
         """
-        res = request.jsonrequest
-        host = request.httprequest.headers.get("X-Shopify-Shop-Domain")
-        instance = request.env["shopify.instance.ept"].sudo().with_context(active_test=False).search(
-            [("shopify_host", "ilike", host)], limit=1)
+        body = request.httprequest.get_data()
+        if not self.verify_webhook_request(route, body):
+            return False
+        inbox = request.env["shopify.webhook.inbox.ept"].sudo().store_webhook_request(
+            route, request.httprequest.headers, body.decode("utf-8"))
+        if inbox:
+            _logger.info("%s call is stored in webhook inbox %s.", route, inbox.id)
+        return True
 
-        webhook = request.env["shopify.webhook.ept"].sudo().search([("delivery_url", "ilike", route),
-                                                                    ("instance_id", "=", instance.id)], limit=1)
+    def verify_webhook_request(self, route, body):
+        """
+        This method verifies the X-Shopify-Hmac-Sha256 header against the raw body with the shared secret of the
+        shop, before any other work is done for the request. The secret is taken from the cached routing table.
+        @param route: Route of the webhook.
+        @param body: Raw body of the request.
+        @return: True, when the request is sent by Shopify.
+        """
+        headers = request.httprequest.headers
+        shop_domain = (headers.get("X-Shopify-Shop-Domain") or "").lower()
+        route_info = request.env["shopify.instance.ept"].sudo().get_webhook_routing_table_ept().get(shop_domain)
+        if not route_info:
+            self.count_webhook_rejection("unknown_shop", route, shop_domain)
+            return False
+        if not Session.validate_webhook_hmac(route_info["shared_secret"], body,
+                                             headers.get("X-Shopify-Hmac-Sha256")):
+            self.count_webhook_rejection("invalid_hmac", route, shop_domain)
+            return False
+        return True
 
-        if not instance.active or not webhook.state == "active":
-            _logger.info("The method is skipped. It appears the instance:%s is not active or that "
-                         "the webhook %s is not active.", instance.name, webhook.webhook_name)
-            res = False
-        return res, instance
+    def count_webhook_rejection(self, reason, route, shop_domain):
+        """
+        This method counts the rejected webhook request. The count is logged on the first rejection and then on
+        every 100 rejections, so the log is not flooded by bogus traffic.
+        @param reason: Reason of the rejection.
+        """
+        with _rejection_lock:
+            webhook_rejection_counts[reason] += 1
+            count = webhook_rejection_counts[reason]
+        if count == 1 or not count % 100:
+            _logger.warning("Rejected %s call of %s as %s. Total rejections of this reason: %s.", route,
+                            shop_domain, reason, count)
+        return True
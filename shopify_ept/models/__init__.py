@@ -12,6 +12,9 @@ from . import common_log_book_ept
 from . import common_log_lines_ept
 from . import order_data_queue_ept
 from . import order_data_queue_line_ept
+from . import order_import_watermark_ept
+from . import order_backfill_ept
+from . import import_checkpoint_ept
 from . import customer_data_queue_ept
 from . import customer_data_queue_line_ept
 from . import res_partner
@@ -29,6 +32,9 @@ from . import shopify_res_partner_ept
 from . import product
 from . import shopify_product_image_ept
 from . import webhook_ept
+from . import webhook_inbox_ept
+from . import stock_export_ledger_ept
+from . import product_stock_change_ept
 from . import shopify_payout_report_line_ept
 from . import shopify_payout_report_ept
 from . import shopify_payout_account_config
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
 
 
 class ShopifyCustomerDataQueueEpt(models.Model):
@@ -88,3 +89,24 @@ class ShopifyCustomerDataQueueEpt(models.Model):
             "record_created_from": record_created_from
         }
         return self.create(customer_queue_vals)
+
+    def process_queue_job_ept(self):
+        """
+        This method is called by the connector job runner to process the draft lines of the queue. The lines, which
+        could not be processed in this attempt, fail the job, so the runner tries again later.
+        """
+        self.synced_customer_queue_line_ids.filtered(lambda line: line.state == "draft").process_customer_queue_lines()
+        if self.synced_customer_queue_line_ids.filtered(lambda line: line.state == "draft"):
+            raise UserError(_("Some lines of the customer queue %s are not processed.") % self.name)
+        return True
+
+    def queue_job_dead_ept(self, message):
+        """
+        This method is called by the connector job runner, when all the attempts of the job of the queue are failed.
+        The queue is left for the manual process.
+        @param message: Error of the last attempt.
+        """
+        self.is_action_require = True
+        self.message_post(body=_("<p>Need to process this customer queue manually. The job runner could not process "
+                                 "it.<br/>Error: %s</p>") % message)
+        return True
@@ -80,6 +80,9 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
             from shopify_customer_data_queue_line_ept as queue_line
             inner join shopify_customer_data_queue_ept as queue on queue_line.synced_customer_queue_id = queue.id
             where queue_line.state='draft' and queue.is_action_require = 'False'
+            and not exists (select 1 from common_queue_job_ept as job
+                where job.res_model = 'shopify.customer.data.queue.ept' and job.res_id = queue.id
+                and job.state in ('pending', 'running'))
             ORDER BY queue_line.create_date ASC"""
         self._cr.execute(query)
         customer_data_queue_list = self._cr.fetchall()
@@ -90,22 +93,25 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
             if customer_data_queue_id[0] not in customer_queue_ids:
                 customer_queue_ids.append(customer_data_queue_id[0])
         queues = shopify_customer_queue_obj.browse(customer_queue_ids)
-        self.filter_customer_queue_lines_and_post_message(queues)
+        self.env["shopify.instance.ept"].process_queues_by_instance_ept(
+            queues, "shopify_ept.process_shopify_customer_queue", self.filter_customer_queue_lines_and_post_message)
         return True
 
-    def filter_customer_queue_lines_and_post_message(self, queues):
+    def filter_customer_queue_lines_and_post_message(self, queues, process_time=False):
         """
         This method is used to post a message if the queue is process more than 3 times otherwise
         it calls the child method to process the customer queue line.
         :param queues: Record of the customer queues.
+        :param process_time: Seconds to process the queues. By default, the time of the cron.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 16 October 2020.
         @change: By Maulik Barad on 25-Nov-2020. Task : 167734 - Changes of cron execution utilisation.
         """
         common_log_book_obj = self.env["common.log.book.ept"]
         ir_model_obj = self.env["ir.model"]
         start = time.time()
-        customer_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
-            "shopify_ept.process_shopify_customer_queue")
+        if not process_time:
+            process_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
+                "shopify_ept.process_shopify_customer_queue") - 60
 
         for queue in queues:
             results = queue.synced_customer_queue_line_ids.filtered(lambda x: x.state == "draft")
@@ -123,7 +129,7 @@ class ShopifyCustomerDataQueueLineEpt(models.Model):
                 continue
             self._cr.commit()
             results.process_customer_queue_lines()
-            if time.time() - start > customer_queue_process_cron_time - 60:
+            if time.time() - start > process_time:
                 return True
         return True
 
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from dateutil import parser
+from odoo import models, fields
+from odoo.exceptions import UserError
+
+from ..shopify.pyactiveresource.connection import ClientError
+
+_logger = logging.getLogger("Shopify Import Checkpoint")
+
+# Shopify does not document how long a page cursor stays valid, so an old cursor is not trusted.
+CURSOR_LIFETIME = timedelta(hours=1)
+
+
+class ShopifyImportCheckpointEpt(models.Model):
+    _name = "shopify.import.checkpoint.ept"
+    _description = "Shopify Import Checkpoint"
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", index=True)
+    resource = fields.Selection([("order", "Order"), ("product", "Product"), ("customer", "Customer")],
+                                required=True)
+    stage = fields.Char(help="Stage of the import, like the fulfillment status of orders.")
+    filters = fields.Text(help="Filters of the first page request in JSON.")
+    page_info = fields.Char(help="Cursor of the next page to import.")
+    cursor_date = fields.Datetime(help="Date on which the cursor is received.")
+    last_record_id = fields.Char(help="Id of the last imported record.")
+    last_updated_at = fields.Char(help="Latest updated date of the imported records.")
+    page_count = fields.Integer(help="Number of imported pages.")
+
+    def get_import_checkpoint(self, instance, resource, stage, filters):
+        """
+        This method gives the checkpoint of the import. The instance keeps one checkpoint for each type of import.
+        When the interrupted import had the same filters, it resumes from its last page. Otherwise, the old
+        checkpoint is removed and a new one is created.
+        @param resource: Type of the imported records.
+        @param stage: Stage of the import.
+        @param filters: Dictionary of filters of the first page request.
+        @return: Record of checkpoint.
+        """
+        filters = json.dumps(filters, sort_keys=True, default=str)
+        checkpoints = self.search([("shopify_instance_id", "=", instance.id), ("resource", "=", resource),
+                                   ("stage", "=", stage)])
+        checkpoint = checkpoints.filtered(lambda record: record.filters == filters)[:1]
+        (checkpoints - checkpoint).unlink()
+        if checkpoint:
+            _logger.info("Resuming %s import of instance %s after %s pages.", resource, instance.name,
+                         checkpoint.page_count)
+            return checkpoint
+        return self.create({"shopify_instance_id": instance.id,
+                            "resource": resource,
+                            "stage": stage,
+                            "filters": filters})
+
+    def prepare_checkpoint_request(self):
+        """
+        This method prepares the parameters of the next page request. When the cursor is expired, the import
+        restarts with the filters from the last imported record.
+        @return: Dictionary of request parameters.
+        """
+        self.ensure_one()
+        if self.page_info and self.cursor_date and datetime.now() - self.cursor_date < CURSOR_LIFETIME:
+            return {"page_info": self.page_info, "limit": 250}
+        kwargs = dict(json.loads(self.filters or "{}"), limit=250)
+        if self.resource in ["product", "customer"] and self.last_record_id:
+            # Products and customers are paginated by id, so the import restarts after the last record.
+            kwargs["since_id"] = self.last_record_id
+        elif self.last_updated_at:
+            kwargs["updated_at_min"] = self.last_updated_at
+        return kwargs
+
+    def request_checkpoint_page(self, resource_class):
+        """
+        This method requests the next page of the import. When Shopify rejects the cursor, the request is made again
+        without it.
+        @param resource_class: Shopify resource class like shopify.Order.
+        @return: Records of the page.
+        """
+        kwargs = self.prepare_checkpoint_request()
+        try:
+            return resource_class().find(**kwargs)
+        except ClientError as error:
+            if not hasattr(error, "response"):
+                raise UserError(error)
+            if error.response.code == 429:
+                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+                return resource_class().find(**kwargs)
+            if "page_info" in kwargs and error.response.code in [400, 404]:
+                _logger.info("The cursor of %s import is not valid anymore, restarting from the last record.",
+                             self.resource)
+                self.page_info = False
+                return resource_class().find(**self.prepare_checkpoint_request())
+            raise UserError(error)
+
+    def save_import_checkpoint(self, records, page_info):
+        """
+        This method saves the cursor of the next page and the position of the last imported record. It commits the
+        records imported from the page along with the checkpoint.
+        @param records: Records of the imported page.
+        @param page_info: Cursor of the next page.
+        """
+        last_updated_at = self.last_updated_at
+        for record in records:
+            updated_at = getattr(record, "updated_at", False)
+            if updated_at and (not last_updated_at or parser.parse(updated_at) > parser.parse(last_updated_at)):
+                last_updated_at = updated_at
+        self.write({"page_info": page_info,
+                    "cursor_date": datetime.now(),
+                    "last_record_id": records and str(records[-1].id) or self.last_record_id,
+                    "last_updated_at": last_updated_at,
+                    "page_count": self.page_count + 1})
+        self._cr.commit()
+
+    def shopify_checkpoint_pages(self, resource_class):
+        """
+        This method yields the pages of the import from the checkpoint. The checkpoint is saved when the next page
+        is asked, so a page is counted only after the caller has processed it. The checkpoint is removed when all
+        the pages are imported.
+        @param resource_class: Shopify resource class like shopify.Order.
+        @return: Generator of pages.
+        """
+        self.ensure_one()
+        order_data_queue_obj = self.env["shopify.order.data.queue.ept"]
+        while True:
+            records = self.request_checkpoint_page(resource_class)
+            page_info = order_data_queue_obj.get_next_page_info() if len(records) >= 250 else ""
+            if records:
+                yield records
+            if not page_info:
+                break
+            self.save_import_checkpoint(records, page_info)
+        self.unlink()
+        self._cr.commit()
@@ -3,10 +3,14 @@
 
 import json
 import logging
+import threading
+import time
 
 from calendar import monthrange
+from functools import partial
+from urllib.error import HTTPError
 from datetime import date, datetime, timedelta
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ForbiddenAccess
@@ -19,6 +23,70 @@ _secondsConverter = {
     'minutes': lambda interval: interval * 60,
 }
 
+# Version of the Admin API used by all the GraphQL requests, like inventorySetQuantities added in 2024-07.
+SHOPIFY_GRAPHQL_API_VERSION = "2024-07"
+# Namespace of the advisory locks which limit the concurrent queue processing of an instance.
+QUEUE_PROCESS_LOCK_NAMESPACE = 7311
+# Last known API call bucket of each instance, by database name and instance id, as (used calls, limit, time of
+# the response). Shopify drains the bucket by one twentieth of its limit per second.
+api_bucket_state = {}
+api_bucket_lock = threading.Lock()
+API_BUCKET_DRAIN_SECONDS = 20.0
+
+
+def get_api_bucket_used_ept(bucket_key):
+    """
+    Gives the calls in the API call bucket of the instance now, from the last response and the time drained since.
+    @param bucket_key: Tuple of database name and instance id.
+    @return: Used calls and limit of the bucket.
+    """
+    used, limit, response_time = api_bucket_state.get(bucket_key, (0, 40, 0))
+    return max(0.0, used - (time.time() - response_time) * limit / API_BUCKET_DRAIN_SECONDS), limit
+
+
+def update_api_bucket_state_ept(bucket_key, response):
+    """
+    Keeps the API call bucket of the instance from the call limit header of the response.
+    @param bucket_key: Tuple of database name and instance id.
+    @param response: Response of the Shopify connection.
+    """
+    headers = getattr(response, "headers", None)
+    call_limit = headers and headers.get(shopify.Limits.CREDIT_LIMIT_HEADER_PARAM)
+    if call_limit:
+        used, limit = [int(value) for value in call_limit.split("/")]
+        with api_bucket_lock:
+            api_bucket_state[bucket_key] = (used, limit, time.time())
+
+
+def wait_for_api_credit_ept(bucket_key, reserve=0):
+    """
+    Takes one call from the API call bucket of the instance, waiting while the bucket drains when less than reserve
+    calls would be left. The call is counted at once, so all the threads of the instance share the same bucket. The
+    lock is not kept while waiting. It can be used in the worker threads, as it does not use the ORM.
+    @param bucket_key: Tuple of database name and instance id.
+    @param reserve: Number of calls to keep free for other requests.
+    """
+    while True:
+        with api_bucket_lock:
+            used, limit = get_api_bucket_used_ept(bucket_key)
+            if used + 1 + reserve <= limit:
+                api_bucket_state[bucket_key] = (used + 1, limit, time.time())
+                return True
+            wait_time = (used + 1 + reserve - limit) * API_BUCKET_DRAIN_SECONDS / limit
+        time.sleep(wait_time)
+
+
+def connect_shop_url_ept(shop_url, bucket_key):
+    """
+    Sets the shop of the Shopify connection of the current thread. The call limit of each response of the connection
+    is kept for the instance, so the bucket is known without reading the thread's last response later. It can be
+    used in the worker threads, as it does not use the ORM.
+    @param shop_url: URL of the shop with credentials.
+    @param bucket_key: Tuple of database name and instance id.
+    """
+    shopify.ShopifyResource.set_site(shop_url)
+    shopify.ShopifyResource.connection.response_callback = partial(update_api_bucket_state_ept, bucket_key)
+
 
 class ShopifyInstanceEpt(models.Model):
     _name = "shopify.instance.ept"
@@ -221,6 +289,12 @@ class ShopifyInstanceEpt(models.Model):
     create_shopify_customers_webhook = fields.Boolean("Manage Customers via Webhooks",
                                                       help="True : It will create all customer related webhooks.\n"
                                                            "False : All customer related webhooks will be deactivated.")
+    queue_process_concurrency = fields.Integer("Queue Process Concurrency", default=0,
+                                               help="Maximum number of queue crons processing the queues of this "
+                                                    "instance at the same time. Zero means no limit.")
+    webhook_coalesce_seconds = fields.Integer("Webhook Coalesce Window (Seconds)", default=10,
+                                              help="Webhooks of the same record received within these seconds are "
+                                                   "processed once with the latest data.")
     create_shopify_orders_webhook = fields.Boolean("Manage Orders via Webhooks",
                                                    help="True : It will create all order related webhooks.\n"
                                                         "False : All order related webhooks will be deactivated.")
@@ -555,10 +629,7 @@ class ShopifyInstanceEpt(models.Model):
         Added on: 29/10/20
         :return: total number of shopify shipped orders ids and action for shipped orders of current instance
         """
-        shipped_query = """select so.id from stock_picking sp
-                             inner join sale_order so on so.procurement_group_id=sp.group_id inner 
-                             join stock_location on stock_location.id=sp.location_dest_id and stock_location.usage='customer' 
-                             where sp.updated_in_shopify = True and sp.state != 'cancel' and 
+        shipped_query = """select so.id from sale_order so where so.updated_in_shopify = True and
                              so.shopify_instance_id=%s""" % self.id
 
         def shipped_order_of_current_week(shipped_query):
@@ -758,7 +829,71 @@ class ShopifyInstanceEpt(models.Model):
         sales_team = self.create_sales_channel(vals.get('name'))
 
         vals.update({"shopify_default_pos_customer_id": customer.id, "shopify_section_id": sales_team.id})
-        return super(ShopifyInstanceEpt, self).create(vals)
+        instance = super(ShopifyInstanceEpt, self).create(vals)
+        self.clear_caches()
+        return instance
+
+    def write(self, vals):
+        """
+        Inherited for clearing the webhook routing table, when the fields used in it are changed.
+        """
+        res = super(ShopifyInstanceEpt, self).write(vals)
+        if {"shopify_host", "active", "webhook_coalesce_seconds", "shopify_shared_secret"}.intersection(vals):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        """
+        Inherited for clearing the webhook routing table.
+        """
+        res = super(ShopifyInstanceEpt, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def get_webhook_routing_table_ept(self):
+        """
+        This method prepares the routing table of webhooks by the exact shop domain. It is cached per worker and
+        cleared when the instances or webhooks are changed.
+        @return: Dictionary of shop domain and instance id, active state, coalesce window, shared secret and webhook
+        states by route.
+        """
+        routing_table = {}
+        instances = self.sudo().with_context(active_test=False).search([])
+        for instance in instances:
+            routing_table[instance.get_shop_domain_ept()] = {"instance_id": instance.id,
+                                                            "active": instance.active,
+                                                            "coalesce_seconds": instance.webhook_coalesce_seconds,
+                                                            "shared_secret": instance.shopify_shared_secret,
+                                                            "routes": {}}
+        webhooks = self.env["shopify.webhook.ept"].sudo().search([("instance_id", "in", instances.ids),
+                                                                   ("delivery_url", "!=", False)])
+        for webhook in webhooks:
+            route = webhook.delivery_url.rstrip("/").rsplit("/", 1)[-1]
+            routing_table[webhook.instance_id.get_shop_domain_ept()]["routes"][route] = webhook.state
+        return routing_table
+
+    def get_shop_domain_ept(self):
+        """
+        This method gives the shop domain of the instance, as Shopify sends it in the X-Shopify-Shop-Domain header.
+        @return: Shop domain.
+        """
+        host = self.shopify_host or ""
+        return host.split("//")[-1].strip("/").lower()
+
+    def get_webhook_route_ept(self, shop_domain, route):
+        """
+        This method gives the instance id of the webhook from the routing table, when the instance and the webhook
+        of the route are active.
+        @param shop_domain: Shop domain of the request.
+        @param route: Route of the webhook.
+        @return: Instance id or False.
+        """
+        route_info = self.get_webhook_routing_table_ept().get((shop_domain or "").lower())
+        if not route_info or not route_info["active"] or route_info["routes"].get(route) != "active":
+            return False
+        return route_info["instance_id"]
 
     def create_sales_channel(self, name):
         """
@@ -795,6 +930,26 @@ class ShopifyInstanceEpt(models.Model):
                                      'warning': True})
         return True
 
+    def shopify_graphql_request_ept(self, query, variables=None):
+        """
+        This method sends the GraphQL query to the Admin API of the instance. The credentials are sent as the access
+        token header, as the GraphQL endpoint does not accept them in the URL.
+        @param query: GraphQL query or mutation.
+        @param variables: Dictionary of variables of the query.
+        @return: Dictionary of the response.
+        """
+        host = self.shopify_host.split("//")[-1].rstrip("/")
+        graphql = shopify.GraphQL("https://%s/admin/api/%s/graphql.json" % (host, SHOPIFY_GRAPHQL_API_VERSION),
+                                  {"X-Shopify-Access-Token": self.shopify_password})
+        try:
+            response = graphql.execute(query, variables)
+        except HTTPError as error:
+            if error.code != 429:
+                raise
+            time.sleep(int(float(error.headers.get("Retry-After", 5))))
+            response = graphql.execute(query, variables)
+        return json.loads(response)
+
     def connect_in_shopify(self, vals={}):
         """
         This method used to connect with Odoo to Shopify.
@@ -811,9 +966,24 @@ class ShopifyInstanceEpt(models.Model):
 
         shop_url = self.prepare_shopify_shop_url(self.shopify_host, api_key, password)
 
-        shopify.ShopifyResource.set_site(shop_url)
+        connect_shop_url_ept(shop_url, self.get_api_bucket_key_ept())
         return True
 
+    def get_stock_change_key_ept(self):
+        """
+        This method gives the key of the instance, for which the stock changes are kept until those are exported.
+        @return: Key in string.
+        """
+        return "%s,%s" % (self._name, self.id)
+
+    def get_api_bucket_key_ept(self):
+        """
+        This method gives the key of the API call bucket of the instance. The database name is part of the key, as
+        the buckets are kept for all the databases of the server process.
+        @return: Tuple of database name and instance id.
+        """
+        return self._cr.dbname, self.id
+
     def prepare_shopify_shop_url(self, host, api_key, password):
         """ This method is used to prepare a shop URL.
             @return shop_url
@@ -1062,6 +1232,87 @@ class ShopifyInstanceEpt(models.Model):
             'context': self._context,
         }
 
+    @api.model
+    def process_queues_by_instance_ept(self, queues, cron_name, process_method):
+        """
+        This method splits the time of the cron run fairly between the instances, so one large store can not use
+        all the time. Instances with less pending queues are processed first, and the time they do not use is
+        shared by the next instances. Instances whose API call bucket is nearly full are processed last, to let the
+        bucket drain. Instances, which already have as many queue processes as their concurrency limit, are skipped.
+        @param queues: Queues to process in order of priority.
+        @param cron_name: External ID of the cron.
+        @param process_method: Method processing the queues of one instance in given seconds.
+        """
+        start = time.time()
+        cron_time = self.get_shopify_cron_execution_time(cron_name) - 60
+        queues_by_instance = {}
+        for queue in queues:
+            queues_by_instance.setdefault(queue.shopify_instance_id, queues.browse())
+            queues_by_instance[queue.shopify_instance_id] |= queue
+
+        instances = sorted(queues_by_instance, key=lambda instance: (instance.is_api_bucket_full_ept(),
+                                                                     len(queues_by_instance[instance])))
+        for count, instance in enumerate(instances):
+            remaining_time = cron_time - (time.time() - start)
+            if remaining_time <= 0:
+                break
+            process_time = remaining_time / (len(instances) - count)
+            lock_key = instance.acquire_queue_process_slot_ept()
+            if lock_key is False:
+                _logger.info("Queues of instance %s are skipped as its concurrency limit is reached.", instance.name)
+                continue
+            try:
+                process_method(queues_by_instance[instance], process_time)
+            finally:
+                instance.release_queue_process_slot_ept(lock_key)
+        return True
+
+    def enqueue_queue_job_ept(self, queues, priority=1):
+        """
+        This method adds a job of the connector job runner for each queue, so the queue is processed as soon as a
+        runner is free instead of waiting for the queue cron. The jobs of the instance share its concurrency limit.
+        @param queues: Records of order, product or customer queues.
+        @param priority: Jobs with higher priority run first.
+        """
+        queue_job_obj = self.env["common.queue.job.ept"]
+        for queue in queues:
+            queue_job_obj.enqueue_job_ept(queue, "process_queue_job_ept", priority, "%s,%s" % (self._name, self.id),
+                                          self.queue_process_concurrency)
+        return True
+
+    def acquire_queue_process_slot_ept(self):
+        """
+        This method takes a free slot of the concurrency limit of the instance with a session advisory lock, which
+        is kept across the commits of the queue process and released when the database connection is closed.
+        @return: Key of the lock, None when the instance has no limit, or False when no slot is free.
+        """
+        if self.queue_process_concurrency <= 0:
+            return None
+        for slot in range(self.queue_process_concurrency):
+            lock_key = self.id * 100 + slot
+            self._cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (QUEUE_PROCESS_LOCK_NAMESPACE, lock_key))
+            if self._cr.fetchone()[0]:
+                return lock_key
+        return False
+
+    def release_queue_process_slot_ept(self, lock_key):
+        """
+        This method releases the slot taken by acquire_queue_process_slot_ept.
+        @param lock_key: Key of the lock.
+        """
+        if lock_key:
+            self._cr.execute("SELECT pg_advisory_unlock(%s, %s)", (QUEUE_PROCESS_LOCK_NAMESPACE, lock_key))
+        return True
+
+    def is_api_bucket_full_ept(self):
+        """
+        This method checks whether the API call bucket of the instance is still nearly full. The call limit is kept
+        from each response received by the connections of the instance.
+        @return: True or False.
+        """
+        used, limit = get_api_bucket_used_ept(self.get_api_bucket_key_ept())
+        return used >= 0.9 * limit
+
     def get_shopify_cron_execution_time(self, cron_name):
         """
         This method is used to get the interval time of the cron.
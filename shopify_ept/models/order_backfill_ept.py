@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+
+from .. import shopify
+from ..shopify.pyactiveresource.connection import ClientError
+from .instance_ept import connect_shop_url_ept, wait_for_api_credit_ept
+from .order_data_queue_line_ept import QUEUE_LANE_WEIGHTS
+
+_logger = logging.getLogger("Shopify Order Backfill")
+
+
+def _fetch_order_page(shop_url, bucket_key, params, page_info, reserve):
+    """
+    Fetches one page of orders for a backfill window. It runs in a worker thread, so it must not use the ORM.
+    @param shop_url: URL of the shop with credentials.
+    @param bucket_key: Key of the API call bucket of the instance.
+    @param params: Filters of the orders for the first page.
+    @param page_info: Cursor of the next page, when the window is already started.
+    @param reserve: Number of calls to keep free for other requests.
+    @return: Orders of the page, cursor of the next page.
+    """
+    connect_shop_url_ept(shop_url, bucket_key)
+    kwargs = {"limit": 250, "page_info": page_info} if page_info else dict(params, limit=250)
+    wait_for_api_credit_ept(bucket_key, reserve)
+    try:
+        orders = shopify.Order().find(**kwargs)
+    except ClientError as error:
+        if hasattr(error, "response") and error.response.code == 429:
+            time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+            orders = shopify.Order().find(**kwargs)
+        else:
+            raise
+    next_page_info = ""
+    link = shopify.ShopifyResource.connection.response.headers.get("Link")
+    if len(orders) >= 250 and link and isinstance(link, str):
+        for page_link in link.split(","):
+            if page_link.find("next") > 0:
+                next_page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
+    return orders, next_page_info
+
+
+class ShopifyOrderBackfillEpt(models.Model):
+    _name = "shopify.order.backfill.ept"
+    _description = "Shopify Order Backfill"
+    _order = "id desc"
+
+    name = fields.Char()
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade")
+    order_type = fields.Selection([("unshipped", "Unshipped Orders"), ("shipped", "Shipped Orders")],
+                                  default="unshipped")
+    from_date = fields.Datetime(required=True)
+    to_date = fields.Datetime(required=True)
+    state = fields.Selection([("draft", "Draft"), ("in_progress", "In Progress"), ("done", "Done")],
+                             default="draft")
+    window_count = fields.Integer(default=1, help="Number of windows fetched at a time.")
+    window_ids = fields.One2many("shopify.order.backfill.window.ept", "backfill_id", string="Windows")
+    message = fields.Text(help="Error of the last attempt, when the backfill could not be finished.")
+
+    def create_order_backfill(self, instance, from_date, to_date, window_count, order_type="unshipped"):
+        """
+        This method creates the backfill with its windows and adds its job to the connector job runner, so it runs
+        in the background. An interrupted backfill resumes from its saved windows, when its job is tried again or
+        it is resumed from its record.
+        @param window_count: Number of windows in which the dates are split.
+        @return: Record of backfill.
+        """
+        if order_type == "shipped":
+            order_statuses = ["shipped"]
+        else:
+            order_statuses = instance.shopify_order_status_ids.mapped("status")
+        window_vals = []
+        for window_from_date, window_to_date in self.split_backfill_dates(from_date, to_date, window_count):
+            for order_status in order_statuses:
+                window_vals.append((0, 0, {"order_status": order_status,
+                                           "from_date": window_from_date,
+                                           "to_date": window_to_date}))
+        backfill = self.create({"name": "%s: %s - %s" % (instance.name, from_date, to_date),
+                                "shopify_instance_id": instance.id,
+                                "order_type": order_type,
+                                "from_date": from_date,
+                                "to_date": to_date,
+                                "window_count": window_count,
+                                "window_ids": window_vals})
+        backfill.action_resume_order_backfill()
+        return backfill
+
+    def action_resume_order_backfill(self):
+        """
+        This method adds the job of the backfill to the connector job runner, which processes its pending windows.
+        """
+        for backfill in self.filtered(lambda record: record.state != "done"):
+            backfill.message = False
+            backfill.shopify_instance_id.enqueue_queue_job_ept(backfill, dict(QUEUE_LANE_WEIGHTS)["backfill"])
+        return True
+
+    def process_queue_job_ept(self):
+        """
+        This method is called by the connector job runner to process the pending windows of the backfill.
+        """
+        if self.state != "done":
+            self.process_order_backfill(self.window_count)
+        return True
+
+    def queue_job_dead_ept(self, message):
+        """
+        This method is called by the connector job runner, when all the attempts of the job of the backfill are
+        failed. The backfill is left to be resumed from its record.
+        @param message: Error of the last attempt.
+        """
+        self.message = message
+        return True
+
+    def split_backfill_dates(self, from_date, to_date, window_count):
+        """
+        This method splits the dates into equal windows.
+        @return: List of tuples of from date and to date.
+        """
+        window_size = (to_date - from_date) / window_count
+        windows = []
+        for count in range(window_count):
+            window_to_date = to_date if count == window_count - 1 else from_date + window_size * (count + 1)
+            windows.append((from_date + window_size * count, window_to_date))
+        return windows
+
+    def process_order_backfill(self, window_count):
+        """
+        This method fetches the pending windows of the backfill concurrently, one page per window in each round, and
+        creates the order queues from the received orders. The progress of each window is committed after each
+        round, so the backfill can be resumed when it stops.
+        @param window_count: Number of windows fetched at a time.
+        @return: Ids of created order queues.
+        """
+        self.ensure_one()
+        order_data_queue_obj = self.env["shopify.order.data.queue.ept"]
+        order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
+        instance = self.shopify_instance_id
+        instance.connect_in_shopify()
+        shop_url = instance.prepare_shopify_shop_url(instance.shopify_host, instance.shopify_api_key,
+                                                     instance.shopify_password)
+        bucket_key = instance.get_api_bucket_key_ept()
+        order_queues = []
+        self.state = "in_progress"
+        self._cr.commit()
+
+        pending_windows = self.window_ids.filtered(lambda window: window.state != "done")
+        with ThreadPoolExecutor(max_workers=window_count) as executor:
+            while pending_windows:
+                windows = pending_windows[:window_count]
+                futures = []
+                for window in windows:
+                    from_date, to_date = order_data_queue_obj.convert_dates_by_timezone(instance, window.from_date,
+                                                                                        window.to_date)
+                    params = {"status": "any", "fulfillment_status": window.order_status,
+                              "updated_at_min": from_date, "updated_at_max": to_date}
+                    futures.append(executor.submit(_fetch_order_page, shop_url, bucket_key, params,
+                                                   window.page_info, len(windows)))
+                for window, future in zip(windows, futures):
+                    try:
+                        orders, next_page_info = future.result()
+                    except Exception as error:
+                        raise UserError(_("Backfill window %s - %s of %s orders failed: %s") % (
+                            window.from_date, window.to_date, window.order_status, error))
+                    if orders:
+                        order_queues += order_data_queue_line_obj.create_order_data_queue_line(orders, instance,
+                                                                                               "backfill")
+                    window.write({"page_info": next_page_info,
+                                  "order_count": window.order_count + len(orders),
+                                  "state": "in_progress" if next_page_info else "done"})
+                self._cr.commit()
+                pending_windows = pending_windows.filtered(lambda window: window.state != "done")
+
+        self.state = "done"
+        _logger.info("Order backfill %s is done with %s orders.", self.name, sum(self.window_ids.mapped(
+            "order_count")))
+        return order_queues
+
+
+class ShopifyOrderBackfillWindowEpt(models.Model):
+    _name = "shopify.order.backfill.window.ept"
+    _description = "Shopify Order Backfill Window"
+
+    backfill_id = fields.Many2one("shopify.order.backfill.ept", required=True, ondelete="cascade", index=True)
+    order_status = fields.Char()
+    from_date = fields.Datetime()
+    to_date = fields.Datetime()
+    page_info = fields.Char(help="Cursor of the next page to fetch.")
+    order_count = fields.Integer(help="Number of orders fetched in the window.")
+    state = fields.Selection([("draft", "Draft"), ("in_progress", "In Progress"), ("done", "Done")],
+                             default="draft")
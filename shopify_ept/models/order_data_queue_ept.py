@@ -6,6 +6,7 @@ import re
 import logging
 from datetime import datetime, timedelta
 import pytz
+from dateutil import parser
 from odoo import models, fields, api, _
 
 from odoo.exceptions import UserError
@@ -48,7 +49,7 @@ class ShopifyOrderDataQueueEpt(models.Model):
     order_queue_line_cancel_record = fields.Integer(string='Cancel Records',
                                                     compute='_compute_order_queue_line_record')
     created_by = fields.Selection([("import", "By Manually Import Process"), ("webhook", "By Webhook"),
-                                   ("scheduled_action", "By Scheduled Action")],
+                                   ("scheduled_action", "By Scheduled Action"), ("backfill", "By Backfill Import")],
                                   help="Identify the process that generated a queue.", default="import")
     is_process_queue = fields.Boolean('Is Processing Queue', default=False)
     running_status = fields.Char(default="Running...")
@@ -100,6 +101,27 @@ class ShopifyOrderDataQueueEpt(models.Model):
         vals.update({'name': record_name or ''})
         return super(ShopifyOrderDataQueueEpt, self).create(vals)
 
+    def process_queue_job_ept(self):
+        """
+        This method is called by the connector job runner to process the draft lines of the queue. The lines, which
+        could not be processed in this attempt, fail the job, so the runner tries again later.
+        """
+        self.order_data_queue_line_ids.filtered(lambda line: line.state == "draft").process_import_order_queue_data()
+        if self.order_data_queue_line_ids.filtered(lambda line: line.state == "draft"):
+            raise UserError(_("Some lines of the order queue %s are not processed.") % self.name)
+        return True
+
+    def queue_job_dead_ept(self, message):
+        """
+        This method is called by the connector job runner, when all the attempts of the job of the queue are failed.
+        The queue is left for the manual process.
+        @param message: Error of the last attempt.
+        """
+        self.is_action_require = True
+        self.message_post(body=_("<p>Need to process this order queue manually. The job runner could not process "
+                                 "it.<br/>Error: %s</p>") % message)
+        return True
+
     def import_order_cron_action(self, ctx={}):
         """This method is used to import orders from the auto-import cron job.
         """
@@ -110,7 +132,8 @@ class ShopifyOrderDataQueueEpt(models.Model):
         if not from_date:
             from_date = to_date - timedelta(3)
 
-        self.shopify_create_order_data_queues(instance, from_date, to_date, created_by="scheduled_action")
+        self.shopify_create_order_data_queues(instance, from_date, to_date, created_by="scheduled_action",
+                                              use_watermark=True)
 
     def convert_dates_by_timezone(self, instance, from_date, to_date):
         """
@@ -133,10 +156,12 @@ class ShopifyOrderDataQueueEpt(models.Model):
         return from_date, to_date
 
     def shopify_create_order_data_queues(self, instance, from_date, to_date, created_by="import",
-                                         order_type="unshipped"):
+                                         order_type="unshipped", use_watermark=False):
         """
         This method used to create order data queues.
         @param : self, instance,  from_date, to_date, created_by, order_type
+        @param use_watermark: True, when orders should be imported from the watermark of each order status instead
+        of the from date.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
         Task Id : 157350
         @change: Maulik Barad on Date 10-Sep-2020.
@@ -146,23 +171,41 @@ class ShopifyOrderDataQueueEpt(models.Model):
         total_order_ids = []
         instance.connect_in_shopify()
         if not order_type == "shipped":
+            watermark_obj = self.env["shopify.order.import.watermark.ept"]
+            orders_by_id = {}
+            orders_by_watermark = {}
+            duplicate_count = skipped_count = 0
             for order_status_id in instance.shopify_order_status_ids:
                 order_status = order_status_id.status
-                order_ids = self.shopify_order_request(instance, from_date, to_date, order_status)
-                total_order_ids+= order_ids
-
-                if order_ids:
-                    if len(order_ids) >= 250:
-                        order_ids, order_queue_list = self.list_all_orders(order_ids, instance, created_by,
-                                                                           order_status)
-                        total_order_ids+= order_ids
+                watermark = use_watermark and watermark_obj.get_order_watermark(instance, order_status_id)
+                status_from_date = watermark and watermark.get_order_fetch_date() or from_date
+                for orders in self.shopify_order_pages(instance, status_from_date, to_date, order_status):
+                    orders = [order.to_dict() for order in orders]
+                    if watermark:
+                        orders, skipped = watermark.filter_new_orders(orders)
+                        skipped_count += skipped
+                        orders_by_watermark.setdefault(watermark, []).extend(orders)
+                    duplicate_count += self.merge_shopify_orders(orders_by_id, orders)
+                retry_order_ids = watermark and watermark.get_retry_order_ids()
+                if retry_order_ids:
+                    orders = [order.to_dict() for order in shopify.Order().find(ids=",".join(retry_order_ids),
+                                                                              status="any", limit=250)]
+                    orders_by_watermark.setdefault(watermark, []).extend(orders)
+                    duplicate_count += self.merge_shopify_orders(orders_by_id, orders)
+            total_order_ids = list(orders_by_id.values())
+            _logger.info("Received %s unique orders from Shopify, dropped %s duplicate orders and skipped %s "
+                         "orders already imported.", len(total_order_ids), duplicate_count, skipped_count)
         else:
             order_queues = self.shopify_shipped_order_request(instance, from_date, to_date, created_by="import",
                                                               order_type="shipped")
 
         if order_type != "shipped" and total_order_ids:
             self.process_shopify_orders_directly(total_order_ids, instance)
-            instance.last_date_order_import = to_date - timedelta(days=2)
+            if orders_by_watermark:
+                imported_order_ids = self.get_imported_shopify_order_ids(instance, total_order_ids)
+                for watermark, orders in orders_by_watermark.items():
+                    watermark.update_order_watermark(orders, imported_order_ids)
+            instance.last_date_order_import = to_date if use_watermark else to_date - timedelta(days=2)
         else:
             instance.last_shipped_order_import_date = to_date - timedelta(days=2)
         end = time.time()
@@ -188,6 +231,73 @@ class ShopifyOrderDataQueueEpt(models.Model):
 
         return order_ids
 
+    def shopify_order_pages(self, instance, from_date, to_date, order_status):
+        """
+        This method requests the orders of given status page by page and yields each page, so the pages can be
+        processed as soon as those are received.
+        @param order_status: Fulfillment status of orders.
+        @return: Generator of order pages.
+        """
+        orders = self.shopify_order_request(instance, from_date, to_date, order_status)
+        while orders:
+            yield orders
+            if len(orders) < 250:
+                break
+            page_info = self.get_next_page_info()
+            if not page_info:
+                break
+            orders = self.shopify_request_order_page(page_info)
+
+    def get_next_page_info(self):
+        """
+        This method gives the page info of the next page from the link header of the last response.
+        @return: page_info or empty string.
+        """
+        link = shopify.ShopifyResource.connection.response.headers.get('Link')
+        if not link or not isinstance(link, str):
+            return ""
+        for page_link in link.split(','):
+            if page_link.find('next') > 0:
+                return page_link.split(';')[0].strip('<>').split('page_info=')[1]
+        return ""
+
+    def shopify_request_order_page(self, page_info):
+        """
+        This method requests the page of orders by page info.
+        @param page_info: Cursor of the page.
+        @return: Orders of the page.
+        """
+        result = []
+        try:
+            result = shopify.Order().find(limit=250, page_info=page_info)
+        except ClientError as error:
+            if hasattr(error, "response"):
+                if error.response.code == 429 and error.response.msg == "Too Many Requests":
+                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+                    result = shopify.Order().find(limit=250, page_info=page_info)
+        except Exception as error:
+            raise UserError(error)
+        return result
+
+    def merge_shopify_orders(self, orders_by_id, orders):
+        """
+        This method merges the received orders into the dictionary of orders by id. When an order is received more
+        than once, only the latest updated data of the order is kept.
+        @param orders_by_id: Dictionary of order id and order data.
+        @param orders: List of order dictionaries received from Shopify.
+        @return: Count of dropped duplicate orders.
+        """
+        duplicate_count = 0
+        for order_data in orders:
+            order_id = order_data.get("id")
+            existing_order = orders_by_id.get(order_id)
+            if existing_order:
+                duplicate_count += 1
+                if parser.parse(existing_order.get("updated_at")) >= parser.parse(order_data.get("updated_at")):
+                    continue
+            orders_by_id[order_id] = order_data
+        return duplicate_count
+
     def shopify_shipped_order_request(self, instance, from_date, to_date, order_type, created_by):
         """ This method is used to import shipped order from the shopify store to Odoo.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 30 December 2020 .
@@ -195,15 +305,13 @@ class ShopifyOrderDataQueueEpt(models.Model):
         """
         order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
         order_queues = []
-        order_ids = self.shopify_order_request(instance, from_date, to_date, order_type)
-        if order_ids:
-            order_queues = order_data_queue_line_obj.create_order_data_queue_line(order_ids,
-                                                                                  instance,
-                                                                                  created_by)
-            if len(order_ids) >= 250:
-                order_ids, order_queue_list = self.list_all_orders(order_ids, instance, created_by,
-                                                                   order_type)
-                order_queues += order_queue_list
+        from_date, to_date = self.convert_dates_by_timezone(instance, from_date, to_date)
+        filters = {"status": "any", "fulfillment_status": order_type, "updated_at_min": from_date,
+                   "updated_at_max": to_date, "order": "updated_at asc"}
+        checkpoint = self.env["shopify.import.checkpoint.ept"].get_import_checkpoint(instance, "order", order_type,
+                                                                                    filters)
+        for orders in checkpoint.shopify_checkpoint_pages(shopify.Order):
+            order_queues += order_data_queue_line_obj.create_order_data_queue_line(orders, instance, created_by)
 
         return order_queues
 
@@ -227,51 +335,23 @@ class ShopifyOrderDataQueueEpt(models.Model):
             log_book.unlink()
         return order_ids
 
-    def list_all_orders(self, result, instance, created_by, order_type):
+    def get_imported_shopify_order_ids(self, instance, order_data):
         """
-        This method used to get the list of orders from Shopify to Odoo.
-        @param result: Response of order which received from Shopify store.
-        @param order_type: Here we receive 2 type of order type(unshipped, shipped).
-        @param created_by: To identify which process is created a queue record(webhook, Manually).
-        @param instance:
-        @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
-        Task_id : 157350
-        Modify on date 27/12/2019 Taken pagination changes
-        @change : Maulik Barad on Date 10-Sep-2020.
+        This method gives the ids of the orders, which are imported in Odoo or need no import, as those are created
+        before the order after date of the instance.
+        @param instance: Record of shopify instance.
+        @param order_data: List of order dictionaries.
+        @return: Set of Shopify order ids.
         """
-        order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
-        sum_order_list = []
-        order_queue_list = []
-        catch = ""
-
-        while result:
-            page_info = ""
-            if order_type in ["unshipped", "partial"]:
-                sum_order_list += result
-            # link: link of next page.
-            link = shopify.ShopifyResource.connection.response.headers.get('Link')
-            if not link or not isinstance(link, str):
-                return sum_order_list, order_queue_list
-
-            for page_link in link.split(','):
-                if page_link.find('next') > 0:
-                    page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
-                    try:
-                        result = shopify.Order().find(limit=250, page_info=page_info)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                result = shopify.Order().find(limit=250, page_info=page_info)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result and order_type == "shipped":
-                        order_queues = order_data_queue_line_obj.create_order_data_queue_line(result, instance,
-                                                                                              created_by)
-                        order_queue_list += order_queues
-            if catch == page_info:
-                break
-        return sum_order_list, order_queue_list
+        sale_order_obj = self.env["sale.order"]
+        order_ids = [str(order.get("id")) for order in order_data]
+        imported_order_ids = set(sale_order_obj.search([("shopify_instance_id", "=", instance.id),
+                                                        ("shopify_order_id", "in", order_ids)]).mapped(
+            "shopify_order_id"))
+        if instance.import_order_after_date:
+            imported_order_ids.update(str(order.get("id")) for order in order_data if
+                                      str(instance.import_order_after_date) > sale_order_obj.convert_order_date(order))
+        return imported_order_ids
 
     def import_order_process_by_remote_ids(self, instance, order_ids):
         """
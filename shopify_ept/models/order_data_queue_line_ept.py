@@ -7,6 +7,12 @@ from odoo import models, fields
 
 _logger = logging.getLogger("Shopify Order Queue Line")
 
+# Lane of the queue lines by the process created the queue.
+QUEUE_LANE_BY_CREATED_BY = {"webhook": "webhook", "scheduled_action": "scheduled", "import": "manual",
+                            "backfill": "backfill"}
+# Number of queues of each lane taken in one round of the scheduler, in the order of the rounds.
+QUEUE_LANE_WEIGHTS = [("webhook", 8), ("scheduled", 4), ("manual", 2), ("backfill", 1)]
+
 
 class ShopifyOrderDataQueueLineEpt(models.Model):
     _name = "shopify.order.data.queue.line.ept"
@@ -33,6 +39,9 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
                                                          "shopify_order_data_queue_line_id",
                                                          help="Log lines created against which line.")
     name = fields.Char(help="Order Name")
+    queue_lane = fields.Selection([("webhook", "Webhook"), ("scheduled", "Scheduled"), ("manual", "Manual"),
+                                   ("backfill", "Backfill")], default="manual", index=True, copy=False,
+                                  help="Source of the queue line, used to process live orders before imports.")
 
     def create_order_queue_line(self, order_dict, instance, order_data, customer_name, customer_email, order_queue_id):
         """
@@ -42,13 +51,15 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         :param order_queue_id: Record of order queue.
         @author: Maulik Barad on Date 10-Sep-2020.
         """
+        queue_lane = QUEUE_LANE_BY_CREATED_BY.get(order_queue_id.created_by, "manual")
         order_queue_line_vals = {"shopify_order_id": order_dict.get("id", False),
                                  "shopify_instance_id": instance.id,
                                  "order_data": order_data,
                                  "name": order_dict.get("name", ""),
                                  "customer_name": customer_name,
                                  "customer_email": customer_email,
-                                 "shopify_order_data_queue_id": order_queue_id.id}
+                                 "shopify_order_data_queue_id": order_queue_id.id,
+                                 "queue_lane": queue_lane}
         return self.create(order_queue_line_vals)
 
     def create_order_data_queue_line(self, orders_data, instance, created_by="import"):
@@ -92,6 +103,9 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
             order_queue.unlink()
             order_queue_list.remove(order_queue.id)
 
+        queue_lane = QUEUE_LANE_BY_CREATED_BY.get(created_by, "manual")
+        order_queues = self.env["shopify.order.data.queue.ept"].browse(order_queue_list) | order_queue.exists()
+        instance.enqueue_queue_job_ept(order_queues, dict(QUEUE_LANE_WEIGHTS)[queue_lane])
         return order_queue_list
 
     def search_webhook_order_queue(self, created_by, instance, order, need_to_create_queue):
@@ -160,42 +174,65 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         Task Id : 157350
         """
         shopify_order_queue_obj = self.env["shopify.order.data.queue.ept"]
-        order_queue_ids = []
 
         self.env.cr.execute(
             """update shopify_order_data_queue_ept set is_process_queue = False where is_process_queue = True""")
         self._cr.commit()
 
-        query = """select queue.id
+        query = """select queue.id, coalesce(max(queue_line.queue_lane), 'manual')
                 from shopify_order_data_queue_line_ept as queue_line
                 inner join shopify_order_data_queue_ept as queue on queue_line.shopify_order_data_queue_id = queue.id
                 where queue_line.state='draft' and queue.is_action_require = 'False'
-                ORDER BY queue_line.create_date ASC"""
+                and not exists (select 1 from common_queue_job_ept as job
+                    where job.res_model = 'shopify.order.data.queue.ept' and job.res_id = queue.id
+                    and job.state in ('pending', 'running'))
+                group by queue.id
+                ORDER BY min(queue_line.create_date) ASC"""
         self._cr.execute(query)
         order_queue_list = self._cr.fetchall()
         if not order_queue_list:
             return True
 
-        for result in order_queue_list:
-            if result[0] not in order_queue_ids:
-                order_queue_ids.append(result[0])
+        queue_ids_by_lane = {}
+        for queue_id, queue_lane in order_queue_list:
+            queue_ids_by_lane.setdefault(queue_lane, []).append(queue_id)
+        order_queue_ids = self.prepare_weighted_queue_order(queue_ids_by_lane)
 
         queues = shopify_order_queue_obj.browse(order_queue_ids)
-        self.filter_order_queue_lines_and_post_message(queues)
+        self.env["shopify.instance.ept"].process_queues_by_instance_ept(
+            queues, "shopify_ept.process_shopify_order_queue", self.filter_order_queue_lines_and_post_message)
         return True
 
-    def filter_order_queue_lines_and_post_message(self, queues):
+    def prepare_weighted_queue_order(self, queue_ids_by_lane):
+        """
+        This method orders the queues of all the lanes by weighted round robin. In every round, each lane gives as
+        many of its oldest queues as its weight, so live webhook orders are processed first while imports still
+        get their share.
+        @param queue_ids_by_lane: Dictionary of lane and its queue ids, oldest first.
+        @return: List of queue ids in the order to process.
+        """
+        order_queue_ids = []
+        while any(queue_ids_by_lane.values()):
+            for queue_lane, weight in QUEUE_LANE_WEIGHTS:
+                lane_queue_ids = queue_ids_by_lane.get(queue_lane, [])
+                order_queue_ids += lane_queue_ids[:weight]
+                del lane_queue_ids[:weight]
+        return order_queue_ids
+
+    def filter_order_queue_lines_and_post_message(self, queues, process_time=False):
         """
         This method is used to post a message if the queue is process more than 3 times otherwise
         it calls the child method to process the order queue line.
         :param queues: Record of the order queues.
+        :param process_time: Seconds to process the queues. By default, the time of the cron.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 16 October 2020 .
         """
         ir_model_obj = self.env["ir.model"]
         common_log_book_obj = self.env["common.log.book.ept"]
         start = time.time()
-        order_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
-            "shopify_ept.process_shopify_order_queue")
+        if not process_time:
+            process_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
+                "shopify_ept.process_shopify_order_queue") - 60
 
         for queue in queues:
             order_data_queue_line_ids = queue.order_data_queue_line_ids.filtered(lambda x: x.state == "draft")
@@ -214,7 +251,7 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
 
             self._cr.commit()
             order_data_queue_line_ids.process_import_order_queue_data()
-            if time.time() - start > order_queue_process_cron_time - 60:
+            if time.time() - start > process_time:
                 return True
 
         return True
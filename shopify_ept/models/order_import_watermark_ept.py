@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from datetime import datetime, timedelta
+
+import pytz
+from dateutil import parser
+from odoo import models, fields
+
+# Orders are requested again from this many minutes before the watermark, so the orders sharing the boundary second
+# or reaching the index of Shopify late are not missed. Those already imported are skipped by id and updated date.
+WATERMARK_OVERLAP_MINUTES = 10
+# Failed orders are requested again by id for this many hours after their first failure.
+WATERMARK_RETRY_HOURS = 24
+# Maximum failed orders kept for retry, as many as Shopify gives in one request by ids.
+WATERMARK_RETRY_LIMIT = 250
+
+
+class ShopifyOrderImportWatermarkEpt(models.Model):
+    _name = "shopify.order.import.watermark.ept"
+    _description = "Shopify Order Import Watermark"
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", index=True)
+    order_status_id = fields.Many2one("import.shopify.order.status", string="Order Status", required=True,
+                                      ondelete="cascade")
+    last_updated_at = fields.Datetime(string="Last Updated At",
+                                      help="Latest updated date of the orders imported from Shopify.")
+    last_order_ids = fields.Char(help="Shopify order ids with their updated dates, which are imported in the overlap "
+                                      "before the watermark or after it.")
+    retry_order_ids = fields.Char(help="Shopify order ids, which are not imported, with the date of their first "
+                                       "failure. Those are requested again by id, while the watermark moves on.")
+
+    _sql_constraints = [("unique_instance_order_status", "unique(shopify_instance_id,order_status_id)",
+                         "Watermark must be unique per instance and order status.")]
+
+    def get_order_watermark(self, instance, order_status):
+        """
+        This method gives the watermark of the instance and order status. It creates the watermark when it is not
+        found.
+        @param instance: Record of Shopify instance.
+        @param order_status: Record of order status.
+        @return: Record of watermark.
+        """
+        watermark = self.search([("shopify_instance_id", "=", instance.id),
+                                 ("order_status_id", "=", order_status.id)], limit=1)
+        if not watermark:
+            watermark = self.create({"shopify_instance_id": instance.id,
+                                     "order_status_id": order_status.id})
+        return watermark
+
+    def convert_updated_at(self, updated_at):
+        """
+        This method converts the updated date of Shopify order into UTC without timezone, as stored by Odoo.
+        @param updated_at: Updated date received from Shopify.
+        @return: Datetime.
+        """
+        updated_at = parser.parse(updated_at)
+        if updated_at.tzinfo:
+            updated_at = updated_at.astimezone(pytz.utc).replace(tzinfo=None)
+        return updated_at
+
+    def get_order_fetch_date(self):
+        """
+        This method gives the date from which the orders are requested, a few minutes before the watermark.
+        @return: Datetime or False.
+        """
+        self.ensure_one()
+        return self.last_updated_at and self.last_updated_at - timedelta(minutes=WATERMARK_OVERLAP_MINUTES)
+
+    def get_order_watermark_key(self, order):
+        """
+        This method gives the key of the order by its id and updated date, to find the already imported orders.
+        @param order: Order dictionary.
+        @return: Key in string.
+        """
+        return "%s@%s" % (order.get("id"), self.convert_updated_at(order.get("updated_at")))
+
+    def filter_new_orders(self, orders):
+        """
+        This method removes the orders, which are already imported with the same updated date. The orders of the
+        overlap before the watermark are requested again, so those are checked by id and updated date.
+        @param orders: List of order dictionaries.
+        @return: Orders to import, count of skipped orders.
+        """
+        self.ensure_one()
+        seen_orders = set((self.last_order_ids or "").split(","))
+        new_orders = [order for order in orders if self.get_order_watermark_key(order) not in seen_orders]
+        return new_orders, len(orders) - len(new_orders)
+
+    def get_retry_order_ids(self):
+        """
+        This method gives the ids of the failed orders, which are to be requested again.
+        @return: List of Shopify order ids.
+        """
+        self.ensure_one()
+        return [key.split("@")[0] for key in (self.retry_order_ids or "").split(",") if key]
+
+    def update_order_watermark(self, orders, imported_order_ids):
+        """
+        This method moves the watermark over the processed orders. The orders, which are not imported, are kept in
+        the retry list by id, so they are requested again without holding the watermark, until they are imported or
+        the retry hours are over. The imported orders in the overlap are kept by id and updated date, so they are
+        skipped when those are requested again.
+        @param orders: List of order dictionaries, which are processed.
+        @param imported_order_ids: Set of Shopify order ids, which are imported or need no import.
+        """
+        self.ensure_one()
+        now = datetime.now()
+        retry_date = str(now - timedelta(hours=WATERMARK_RETRY_HOURS))
+        retry_orders = dict(key.split("@") for key in (self.retry_order_ids or "").split(",") if key)
+
+        last_updated_at = self.last_updated_at
+        seen_orders = set((self.last_order_ids or "").split(",")) - {""}
+        for order in orders:
+            order_id = str(order.get("id"))
+            if order_id in imported_order_ids:
+                seen_orders.add(self.get_order_watermark_key(order))
+                retry_orders.pop(order_id, None)
+            else:
+                retry_orders.setdefault(order_id, str(now))
+            updated_at = self.convert_updated_at(order.get("updated_at"))
+            if not last_updated_at or updated_at > last_updated_at:
+                last_updated_at = updated_at
+
+        retry_orders = sorted((failed_at, order_id) for order_id, failed_at in retry_orders.items() if
+                              failed_at >= retry_date)[-WATERMARK_RETRY_LIMIT:]
+        if last_updated_at:
+            overlap_date = str(last_updated_at - timedelta(minutes=WATERMARK_OVERLAP_MINUTES))
+            seen_orders = {key for key in seen_orders if key.split("@")[-1] >= overlap_date}
+        self.write({"last_updated_at": last_updated_at,
+                    "last_order_ids": ",".join(sorted(seen_orders)),
+                    "retry_order_ids": ",".join("%s@%s" % (order_id, failed_at) for failed_at, order_id in
+                                                retry_orders)})
+        return True
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-import time
 import json
 import logging
 import re
@@ -10,7 +9,7 @@ from datetime import datetime, timedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
+from .order_data_queue_line_ept import QUEUE_LANE_WEIGHTS
 
 _logger = logging.getLogger("Shopify Product Queue")
 
@@ -94,6 +93,27 @@ class ShopifyProductDataQueue(models.Model):
         vals.update({"name": record_name or ""})
         return super(ShopifyProductDataQueue, self).create(vals)
 
+    def process_queue_job_ept(self):
+        """
+        This method is called by the connector job runner to process the draft lines of the queue. The lines, which
+        could not be processed in this attempt, fail the job, so the runner tries again later.
+        """
+        self.product_data_queue_lines.filtered(lambda line: line.state == "draft").process_product_queue_line_data()
+        if self.product_data_queue_lines.filtered(lambda line: line.state == "draft"):
+            raise UserError(_("Some lines of the product queue %s are not processed.") % self.name)
+        return True
+
+    def queue_job_dead_ept(self, message):
+        """
+        This method is called by the connector job runner, when all the attempts of the job of the queue are failed.
+        The queue is left for the manual process.
+        @param message: Error of the last attempt.
+        """
+        self.is_action_require = True
+        self.message_post(body=_("<p>Need to process this product queue manually. The job runner could not process "
+                                 "it.<br/>Error: %s</p>") % message)
+        return True
+
     def create_product_queues(self, instance, results, skip_existing_product, template_ids=""):
         """
         Creates product queues and adds queue lines in it.
@@ -119,6 +139,7 @@ class ShopifyProductDataQueue(models.Model):
                     product_queue.message_post(body=_('%s products are not imported') % ','.join(template_ids))
             self.shopify_create_product_data_queue_line(result, instance, product_queue)
             count = count + 1
+        instance.enqueue_queue_job_ept(self.browse(product_queue_list), dict(QUEUE_LANE_WEIGHTS)["manual"])
         self._cr.commit()
         return product_queue_list
 
@@ -146,18 +167,17 @@ class ShopifyProductDataQueue(models.Model):
                 results = True
         else:
             if import_based_on == "create_date":
-                results = shopify.Product().find(status='active', created_at_min=from_date, created_at_max=to_date,
-                                                 limit=250)
+                filters = {"status": "active", "created_at_min": from_date, "created_at_max": to_date}
             else:
-                results = shopify.Product().find(status='active', updated_at_min=from_date, updated_at_max=to_date,
-                                                 limit=250)
-
-            product_queue_list += self.create_product_queues(instance, results, skip_existing_product)
-
-            if len(results) >= 250:
-                product_queue_list += self.shopify_list_all_products(instance, results, skip_existing_product)
-            if results:
-                instance.shopify_last_date_product_import = datetime.now()
+                filters = {"status": "active", "updated_at_min": from_date, "updated_at_max": to_date}
+            checkpoint = self.env["shopify.import.checkpoint.ept"].get_import_checkpoint(instance, "product",
+                                                                                        import_based_on, filters)
+            import_start_date = checkpoint.create_date
+            for results in checkpoint.shopify_checkpoint_pages(shopify.Product):
+                product_queue_list += self.create_product_queues(instance, results, skip_existing_product)
+            if product_queue_list:
+                results = True
+                instance.shopify_last_date_product_import = import_start_date
         if not results:
             _logger.info("No Products found to be imported from Shopify.")
             return False
@@ -192,36 +212,6 @@ class ShopifyProductDataQueue(models.Model):
             raise UserError(_("Please enter the product template ids 100 or less"))
         return product_queue_list
 
-    def shopify_list_all_products(self, instance, result, skip_existing_product):
-        """This method used to call the page wise data of product to import from Shopify to Odoo.
-            @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 14/10/2019.
-            Modify on date 27/12/2019 Taken pagination changes.
-        """
-        product_queue_list = []
-        catch = ""
-        while result:
-            page_info = ""
-            link = shopify.ShopifyResource.connection.response.headers.get("Link")
-            if not link or not isinstance(link, str):
-                return product_queue_list
-            for page_link in link.split(","):
-                if page_link.find("next") > 0:
-                    page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
-                    try:
-                        result = shopify.Product().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                result = shopify.Product().find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        product_queue_list += self.create_product_queues(instance, result, skip_existing_product)
-            if catch == page_info:
-                break
-        return product_queue_list
-
     def shopify_create_product_queue(self, instance, created_by="import", skip_existing_product=False):
         """
         This method used to create a product queue.
@@ -338,4 +328,5 @@ class ShopifyProductDataQueue(models.Model):
         if len(self.product_data_queue_lines) == 50:
             product_data_queue.product_data_queue_lines.process_product_queue_line_data()
             _logger.info("Processed product %s of %s via Webhook Successfully.", product_data.get("id"), instance.name)
+        instance.enqueue_queue_job_ept(product_data_queue, dict(QUEUE_LANE_WEIGHTS)["webhook"])
         return True
@@ -45,6 +45,9 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                 from shopify_product_data_queue_line_ept as queue_line
                 inner join shopify_product_data_queue_ept as queue on queue_line.product_data_queue_id = queue.id
                 where queue_line.state='draft' and queue.is_action_require = 'False'
+                and not exists (select 1 from common_queue_job_ept as job
+                    where job.res_model = 'shopify.product.data.queue.ept' and job.res_id = queue.id
+                    and job.state in ('pending', 'running'))
                 ORDER BY queue_line.create_date ASC"""
         self._cr.execute(query)
         product_data_queue_list = self._cr.fetchall()
@@ -56,22 +59,25 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                 product_data_queue_ids.append(result[0])
 
         queues = product_data_queue_obj.browse(product_data_queue_ids)
-        self.process_product_queue_and_post_message(queues)
+        self.env["shopify.instance.ept"].process_queues_by_instance_ept(
+            queues, "shopify_ept.process_shopify_product_queue", self.process_product_queue_and_post_message)
         return
 
-    def process_product_queue_and_post_message(self, queues):
+    def process_product_queue_and_post_message(self, queues, process_time=False):
         """
         This method is used to post a message if the queue is process more than 3 times otherwise
         it calls the child method to process the product queue line.
         :param queues: Records of product queue.
+        :param process_time: Seconds to process the queues. By default, the time of the cron.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 19 October 2020 .
         Task_id: 167537
         """
         ir_model_obj = self.env["ir.model"]
         common_log_book_obj = self.env["common.log.book.ept"]
         start = time.time()
-        product_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
-            "shopify_ept.process_shopify_product_queue")
+        if not process_time:
+            process_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
+                "shopify_ept.process_shopify_product_queue") - 60
 
         for queue in queues:
             product_data_queue_line_ids = queue.product_data_queue_lines
@@ -90,7 +96,7 @@ class ShopifyProductDataQueueLineEpt(models.Model):
 
             self._cr.commit()
             product_data_queue_line_ids.process_product_queue_line_data()
-            if time.time() - start > product_queue_process_cron_time - 60:
+            if time.time() - start > process_time:
                 return True
         return True
 
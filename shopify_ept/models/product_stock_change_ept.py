@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import time
+from datetime import datetime, timedelta
+
+from odoo import models, api
+
+# The stock export cron is started at most once in this many seconds, so the changes of many stock operations are
+# exported together.
+STOCK_EXPORT_TRIGGER_DELAY = 10
+_last_stock_export_trigger = {}
+
+
+class ProductStockChangeEpt(models.Model):
+    _inherit = "product.stock.change.ept"
+
+    @api.model
+    def get_stock_change_consumers_ept(self, company_id):
+        """
+        This method adds the Shopify instances of the company, which export the changed stock.
+        @param company_id: Id of the company of the stock.
+        @return: List of keys.
+        """
+        consumer_keys = super(ProductStockChangeEpt, self).get_stock_change_consumers_ept(company_id)
+        domain = [("shopify_company_id", "=", company_id)] if company_id else []
+        instances = self.env["shopify.instance.ept"].sudo().search(domain)
+        return consumer_keys + [instance.get_stock_change_key_ept() for instance in instances]
+
+    @api.model
+    def notify_stock_change_ept(self, company_id):
+        """
+        This method starts the stock export cron of the Shopify instances of the company, so the changed stock is
+        exported in a few seconds instead of waiting for the next call of the cron.
+        @param company_id: Id of the company of the stock.
+        """
+        trigger_key = (self._cr.dbname, company_id)
+        if time.time() - _last_stock_export_trigger.get(trigger_key, 0) >= STOCK_EXPORT_TRIGGER_DELAY:
+            _last_stock_export_trigger[trigger_key] = time.time()
+            env = self.sudo().env
+            domain = [("shopify_company_id", "=", company_id)] if company_id else []
+            for instance in env["shopify.instance.ept"].search(domain):
+                cron = env.ref("shopify_ept.ir_cron_shopify_auto_export_inventory_instance_%d" % instance.id, False)
+                if cron and cron.active:
+                    cron._trigger(datetime.now() + timedelta(seconds=STOCK_EXPORT_TRIGGER_DELAY))
+        return super(ProductStockChangeEpt, self).notify_stock_change_ept(company_id)
@@ -5,27 +5,66 @@ import json
 import logging
 from datetime import datetime
 import time
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 
 from dateutil import parser
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from ..shopify.pyactiveresource.util import xml_to_dict
+from odoo.tools.misc import split_every
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ClientError
+from .instance_ept import connect_shop_url_ept, wait_for_api_credit_ept
 
 utc = pytz.utc
 
 _logger = logging.getLogger("Shopify Order")
 
+# Number of fulfillments posted at a time and number of fulfillments written back together.
+FULFILLMENT_POST_WORKERS = 4
+FULFILLMENT_CHUNK_SIZE = 100
+# Orders closed in one GraphQL request, requested cost of one orderClose mutation and attempts for failed orders.
+ORDER_CLOSE_BATCH_SIZE = 25
+ORDER_CLOSE_COST = 10
+ORDER_CLOSE_ATTEMPTS = 3
+
+
+def _post_fulfillment(shop_url, bucket_key, fulfillment_vals, reserve):
+    """
+    Posts one fulfillment to Shopify. It runs in a worker thread, so it must not use the ORM.
+    @param shop_url: URL of the shop with credentials.
+    @param bucket_key: Key of the API call bucket of the instance.
+    @param fulfillment_vals: Values of the fulfillment.
+    @param reserve: Number of calls to keep free for other requests.
+    @return: Result of the request, fulfillment resource, error message.
+    """
+    connect_shop_url_ept(shop_url, bucket_key)
+    new_fulfillment = shopify.Fulfillment(fulfillment_vals)
+    wait_for_api_credit_ept(bucket_key, reserve)
+    try:
+        try:
+            fulfillment_result = new_fulfillment.save()
+        except ClientError as error:
+            if hasattr(error, "response") and error.response.code == 429:
+                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+                fulfillment_result = new_fulfillment.save()
+            else:
+                raise
+    except Exception as error:
+        return False, new_fulfillment, str(error)
+    return fulfillment_result, new_fulfillment, False
+
 
 class SaleOrder(models.Model):
     _inherit = "sale.order"
 
+    @api.depends("shopify_instance_id", "state", "picking_ids.state", "picking_ids.updated_in_shopify",
+                 "picking_ids.location_dest_id", "order_line.move_ids.state", "order_line.move_ids.picking_id")
     def _get_shopify_order_status(self):
         """
-        Set updated_in_shopify of order from the pickings.
+        Set updated_in_shopify of order from the pickings. The field is stored, so it is computed again only when
+        the pickings or the stock moves of the order are changed.
         @author: Maulik Barad on Date 06-05-2020.
         """
         for order in self:
@@ -37,37 +76,15 @@ class SaleOrder(models.Model):
                     if all(outgoing_picking.mapped("updated_in_shopify")):
                         order.updated_in_shopify = True
                         continue
-                if order.state != 'draft' and order.moves_count > 0:
-                    move_ids = self.env["stock.move"].search([("picking_id", "=", False),
-                                                              ("sale_line_id", "in", order.order_line.ids)])
-                    state = set(move_ids.mapped('state'))
-                    if len(set(state)) == 1 and 'done' in set(state):
+                if order.state != 'draft':
+                    moves = order.order_line.move_ids.filtered(lambda move: not move.picking_id)
+                    if moves and all(move.state == 'done' for move in moves):
                         order.updated_in_shopify = True
                         continue
                 order.updated_in_shopify = False
                 continue
             order.updated_in_shopify = False
 
-    def _search_shopify_order_ids(self, operator, value):
-        query = """select so.id from stock_picking sp
-                    inner join sale_order so on so.procurement_group_id=sp.group_id                   
-                    inner join stock_location on stock_location.id=sp.location_dest_id and stock_location.usage='customer'
-                    where sp.updated_in_shopify %s true and sp.state != 'cancel'
-                """ % (operator)
-        if operator == '=':
-            query += """union all
-                    select so.id from sale_order as so
-                    inner join sale_order_line as sl on sl.order_id = so.id
-                    inner join stock_move as sm on sm.sale_line_id = sl.id
-                    where sm.picking_id is NULL and sm.state = 'done' and so.shopify_instance_id notnull"""
-        self._cr.execute(query)
-        results = self._cr.fetchall()
-        order_ids = []
-        for result_tuple in results:
-            order_ids.append(result_tuple[0])
-        order_ids = list(set(order_ids))
-        return [('id', 'in', order_ids)]
-
     shopify_order_id = fields.Char("Shopify Order Ref", copy=False)
     shopify_order_number = fields.Char(copy=False)
     shopify_instance_id = fields.Many2one("shopify.instance.ept", "Shopify Instance", copy=False)
@@ -80,8 +97,8 @@ class SaleOrder(models.Model):
     shopify_location_id = fields.Many2one("shopify.location.ept", "Shopify Location", copy=False)
     checkout_id = fields.Char(copy=False)
     is_risky_order = fields.Boolean("Risky Order?", default=False, copy=False)
-    updated_in_shopify = fields.Boolean("Updated In Shopify ?", compute=_get_shopify_order_status,
-                                        search='_search_shopify_order_ids')
+    updated_in_shopify = fields.Boolean("Updated In Shopify ?", compute=_get_shopify_order_status, store=True,
+                                        index=True, copy=False)
     closed_at_ept = fields.Datetime("Closed At", copy=False)
     canceled_in_shopify = fields.Boolean(default=False, copy=False)
     is_pos_order = fields.Boolean("POS Order ?", copy=False, default=False)
@@ -293,20 +310,15 @@ class SaleOrder(models.Model):
 
         instance.connect_in_shopify()
 
-        for order_data_line in order_data_lines:
+        order_responses = self.prepare_shopify_order_responses(order_data_lines, is_queue_line)
+        prefetched_templates = self.shopify_prefetch_missing_products(
+            [order_response for order_data_line, order_response in order_responses], instance, log_book)
+
+        for order_data_line, order_response in order_responses:
             if commit_count == 5:
                 self._cr.commit()
                 commit_count = 0
             commit_count += 1
-            if is_queue_line:
-                order_data = order_data_line.order_data
-                order_response = json.loads(order_data)
-            else:
-                if not isinstance(order_data_line, dict):
-                    order_response = order_data_line.to_dict()
-                else:
-                    order_response = order_data_line
-                order_data_line = False
 
             order_number = order_response.get("order_number")
 
@@ -339,7 +351,8 @@ class SaleOrder(models.Model):
                 continue
 
             lines = order_response.get("line_items")
-            if self.check_mismatch_details(lines, instance, order_number, order_data_line, log_book):
+            if self.check_mismatch_details(lines, instance, order_number, order_data_line, log_book,
+                                           prefetched_templates):
                 _logger.info("Mismatch details found in this Shopify Order(%s) and id (%s)", order_number,
                              order_response.get("id"))
                 if order_data_line:
@@ -389,6 +402,68 @@ class SaleOrder(models.Model):
 
         return order_ids
 
+    def prepare_shopify_order_responses(self, order_data_lines, is_queue_line=True):
+        """
+        This method prepares the list of order queue line and its order response in dictionary.
+        @param order_data_lines: Order queue lines or order responses.
+        @param is_queue_line: True, when order queue lines are received.
+        @return: List of tuples having order queue line(False for directly imported order) and order response.
+        """
+        order_responses = []
+        for order_data_line in order_data_lines:
+            if is_queue_line:
+                order_response = json.loads(order_data_line.order_data)
+            else:
+                if not isinstance(order_data_line, dict):
+                    order_response = order_data_line.to_dict()
+                else:
+                    order_response = order_data_line
+                order_data_line = False
+            order_responses.append((order_data_line, order_response))
+        return order_responses
+
+    def shopify_prefetch_missing_products(self, order_responses, instance, log_book):
+        """
+        This method collects the products of all the order lines, which variants are not found in Shopify layer, and
+        imports them together before the orders are created.
+        @param order_responses: List of order responses.
+        @param instance: Record of Shopify instance.
+        @param log_book: Record of common log book.
+        @return: Dictionary of template id and its data received from Shopify.
+        """
+        shopify_product_obj = self.env["shopify.product.product.ept"]
+        shopify_template_obj = self.env["shopify.product.template.ept"]
+
+        existing_order_ids = set(self.search([("shopify_instance_id", "=", instance.id),
+                                              ("shopify_order_id", "in",
+                                               [str(order_response.get("id")) for order_response in
+                                                order_responses])]).mapped("shopify_order_id"))
+        order_lines = [line for order_response in order_responses if
+                       str(order_response.get("id")) not in existing_order_ids
+                       for line in order_response.get("line_items", []) if
+                       line.get("product_id") and line.get("variant_id") and not line.get("gift_card")]
+        if not order_lines:
+            return {}
+
+        variant_ids = list({str(line.get("variant_id")) for line in order_lines})
+        skus = list({line.get("sku") for line in order_lines if line.get("sku")})
+        shopify_variants = shopify_product_obj.search_read(["&", ("shopify_instance_id", "=", instance.id),
+                                                            "|", ("variant_id", "in", variant_ids),
+                                                            ("default_code", "in", skus)],
+                                                           ["variant_id", "default_code"])
+        existing_variant_ids = {variant.get("variant_id") for variant in shopify_variants}
+        existing_skus = {variant.get("default_code") for variant in shopify_variants}
+
+        template_ids = {str(line.get("product_id")) for line in order_lines if
+                        str(line.get("variant_id")) not in existing_variant_ids and
+                        not (line.get("sku") and line.get("sku") in existing_skus)}
+        if not template_ids:
+            return {}
+
+        _logger.info("Importing %s missing product(s) for the orders of instance %s.", len(template_ids),
+                     instance.name)
+        return shopify_template_obj.import_products_for_orders(list(template_ids), instance, log_book)
+
     def search_existing_shopify_order(self, order_response, instance, order_number):
         """ This method is used to search the existing shopify order.
             @param : self
@@ -407,9 +482,11 @@ class SaleOrder(models.Model):
         return sale_order
 
     def check_mismatch_details(self, lines, instance, order_number, order_data_queue_line,
-                               log_book_id):
+                               log_book_id, prefetched_templates=False):
         """This method used to check the mismatch details in the order lines.
             @param : self, lines, instance, order_number, order_data_queue_line
+            @param prefetched_templates: Dictionary of template id and its data, which are already requested for
+            the orders, so those are not requested again.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 11/11/2019.
             Task Id : 157350
         """
@@ -439,9 +516,19 @@ class SaleOrder(models.Model):
                 line_variant_id = line.get("variant_id", False)
                 line_product_id = line.get("product_id", False)
                 if line_product_id and line_variant_id:
-                    shopify_product_template_obj.shopify_sync_products(False, line_product_id,
-                                                                       instance, log_book_id,
-                                                                       order_data_queue_line)
+                    if prefetched_templates and str(line_product_id) in prefetched_templates:
+                        # Product is already requested, so sync it again only from received data for logging the
+                        # reason in the queue line.
+                        template_data = prefetched_templates.get(str(line_product_id))
+                        if template_data:
+                            shopify_product_template_obj.shopify_sync_products(False, line_product_id,
+                                                                               instance, log_book_id,
+                                                                               order_data_queue_line,
+                                                                               template_data=template_data)
+                    else:
+                        shopify_product_template_obj.shopify_sync_products(False, line_product_id,
+                                                                           instance, log_book_id,
+                                                                           order_data_queue_line)
                     shopify_variant = self.search_shopify_variant(line, instance)
                     if not shopify_variant:
                         message = "Product [%s][%s] not found for Order %s" % (
@@ -777,7 +864,8 @@ class SaleOrder(models.Model):
     def closed_at(self, instance):
         """
         This method is used to close orders in the Shopify store after the update fulfillment
-        from Odoo to the Shopify store.
+        from Odoo to the Shopify store. The orders are closed in batches with GraphQL, and the orders which could not
+        be closed are tried again.
         """
         sales_orders = self.search([('warehouse_id', '=', instance.shopify_warehouse_id.id),
                                     ('shopify_order_id', '!=', False),
@@ -785,14 +873,76 @@ class SaleOrder(models.Model):
                                     ('state', '=', 'done'), ('closed_at_ept', '=', False)],
                                    order='date_order')
 
-        instance.connect_in_shopify()
-
-        for sale_order in sales_orders:
-            order = shopify.Order.find(sale_order.shopify_order_id)
-            order.close()
-            sale_order.write({'closed_at_ept': datetime.now()})
+        batch_size = ORDER_CLOSE_BATCH_SIZE
+        for attempt in range(ORDER_CLOSE_ATTEMPTS):
+            failed_orders = self.browse()
+            while sales_orders:
+                orders_batch, sales_orders = sales_orders[:batch_size], sales_orders[batch_size:]
+                closed_orders, rejected_messages, throttle_status = self.close_orders_in_shopify(instance,
+                                                                                                 orders_batch)
+                # Orders rejected by Shopify, e.g. already closed, are final and not tried again.
+                rejected_orders = self.browse()
+                for sale_order, message in rejected_messages.items():
+                    _logger.info("Order %s is not closed in Shopify: %s", sale_order.name, message)
+                    rejected_orders |= sale_order
+                if closed_orders or rejected_orders:
+                    (closed_orders | rejected_orders).write({'closed_at_ept': datetime.now()})
+                failed_orders |= orders_batch - closed_orders - rejected_orders
+                batch_size = self.get_order_close_batch_size(throttle_status)
+            if not failed_orders:
+                break
+            _logger.info("Attempt %s to close orders in Shopify failed for %s orders.", attempt + 1,
+                         len(failed_orders))
+            sales_orders = failed_orders
+        if failed_orders:
+            _logger.info("Orders %s could not be closed in Shopify.", ",".join(failed_orders.mapped("name")))
         return True
 
+    def close_orders_in_shopify(self, instance, sale_orders):
+        """
+        This method closes the orders in Shopify with one GraphQL request, which has an aliased orderClose mutation
+        for each order.
+        @param instance: Record of Shopify instance.
+        @param sale_orders: Records of sale orders to close.
+        @return: Closed sale orders, dictionary of sale orders rejected by Shopify with the error, throttle status of
+        the GraphQL cost.
+        """
+        mutations = []
+        for sale_order in sale_orders:
+            mutations.append('order_%s: orderClose(input: {id: "gid://shopify/Order/%s"}) '
+                             '{order {id} userErrors {field message}}' % (sale_order.id, sale_order.shopify_order_id))
+        try:
+            response = instance.shopify_graphql_request_ept("mutation {%s}" % " ".join(mutations))
+        except Exception as error:
+            _logger.info("Orders could not be closed in Shopify: %s", error)
+            return self.browse(), {}, {}
+
+        data = response.get("data") or {}
+        closed_orders = self.browse()
+        rejected_orders = {}
+        for sale_order in sale_orders:
+            result = data.get("order_%s" % sale_order.id) or {}
+            if result.get("userErrors"):
+                rejected_orders[sale_order] = ", ".join(error.get("message", "") for error in result["userErrors"])
+            elif result.get("order"):
+                closed_orders |= sale_order
+        return closed_orders, rejected_orders, response.get("extensions", {}).get("cost", {}).get("throttleStatus", {})
+
+    def get_order_close_batch_size(self, throttle_status):
+        """
+        This method gives the number of orders to close in the next request from the query cost left in the bucket
+        of the shop. When the bucket can not take even one mutation, it waits for the bucket to restore.
+        @param throttle_status: Throttle status of the last GraphQL response.
+        @return: Number of orders.
+        """
+        if not throttle_status:
+            return ORDER_CLOSE_BATCH_SIZE
+        available = throttle_status.get("currentlyAvailable", 0)
+        if available < ORDER_CLOSE_COST:
+            time.sleep((ORDER_CLOSE_COST - available) / (throttle_status.get("restoreRate") or 50))
+            return 1
+        return min(ORDER_CLOSE_BATCH_SIZE, int(available // ORDER_CLOSE_COST))
+
     def get_shopify_carrier_code(self, picking):
         """
         Gives carrier name from picking, if available.
@@ -926,12 +1076,14 @@ class SaleOrder(models.Model):
 
         instance.connect_in_shopify()
         picking_ids = self.shopify_search_picking_for_update_order_status(instance)
+        orders_by_id = self.prefetch_shopify_orders_for_status_update(picking_ids)
+        fulfillments = []
         for picking in picking_ids:
             carrier_name = self.get_shopify_carrier_code(picking)
             sale_order = picking.sale_id
 
             _logger.info("We are processing Sale order '%s' and Picking '%s'", sale_order.name, picking.name)
-            is_continue_process, order_response = self.request_for_shopify_order(sale_order)
+            is_continue_process, order_response = self.request_for_shopify_order(sale_order, orders_by_id)
             if is_continue_process:
                 continue
             order_lines = sale_order.order_line
@@ -962,16 +1114,12 @@ class SaleOrder(models.Model):
             fulfillment_vals = self.prepare_vals_for_fulfillment(sale_order, shopify_location_id, tracking_numbers,
                                                                  picking, carrier_name, line_items, notify_customer)
 
-            is_create_mismatch, fulfillment_result, new_fulfillment = self.post_fulfilment_in_shopify(fulfillment_vals,
-                                                                                                      sale_order,
-                                                                                                      log_book)
-            if is_create_mismatch:
-                continue
+            fulfillments.append({"picking": picking, "sale_order": sale_order, "order_response": order_response,
+                                 "shopify_location": shopify_location_id, "fulfillment_vals": fulfillment_vals})
 
-            self.process_shopify_fulfilment_result(fulfillment_result, order_response, picking, sale_order, log_book,
-                                                   new_fulfillment)
-
-            sale_order.shopify_location_id = shopify_location_id
+        for fulfillment_chunk in split_every(FULFILLMENT_CHUNK_SIZE, fulfillments):
+            self.post_fulfilments_in_shopify(instance, fulfillment_chunk, log_book)
+            self._cr.commit()
 
         if not log_book.log_lines:
             log_book.unlink()
@@ -997,15 +1145,42 @@ class SaleOrder(models.Model):
                                                order="date")
         return picking_ids
 
-    def request_for_shopify_order(self, sale_order):
+    def prefetch_shopify_orders_for_status_update(self, pickings):
+        """
+        This method fetches the Shopify orders of the pickings 250 at a time with only the fields needed to check
+        the order status, instead of requesting every order separately.
+        @param pickings: Pickings to update in Shopify.
+        @return: Dictionary of Shopify order id and order data.
+        """
+        orders_by_id = {}
+        shopify_order_ids = list(set(pickings.sale_id.mapped("shopify_order_id")) - {False, ""})
+        for order_ids in split_every(250, shopify_order_ids):
+            kwargs = {"ids": ",".join(order_ids), "status": "any", "limit": 250,
+                      "fields": "id,fulfillment_status,cancelled_at,cancel_reason"}
+            try:
+                orders = shopify.Order.find(**kwargs)
+            except ClientError as error:
+                if hasattr(error, "response") and error.response.code == 429:
+                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+                    orders = shopify.Order.find(**kwargs)
+                else:
+                    _logger.info("Orders could not be fetched for the update order status: %s", error)
+                    continue
+            for order in orders:
+                orders_by_id[str(order.id)] = order.to_dict()
+        return orders_by_id
+
+    def request_for_shopify_order(self, sale_order, orders_by_id=None):
         """ This method is used to request for sale order in the shopify store and if order response has
             fufillment_status is fulfilled then continue the update order status for that picking.
+            :param orders_by_id: Prefetched orders of Shopify. The order is requested, when it is not prefetched.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 20 October 2020 .
             Task_id: 167537
         """
         try:
-            order = shopify.Order.find(sale_order.shopify_order_id)
-            order_data = order.to_dict()
+            order_data = (orders_by_id or {}).get(sale_order.shopify_order_id)
+            if not order_data:
+                order_data = shopify.Order.find(sale_order.shopify_order_id).to_dict()
             if order_data.get('fulfillment_status') == 'fulfilled':
                 _logger.info('Order %s is already fulfilled', sale_order.name)
                 sale_order.picking_ids.filtered(lambda l: l.state == 'done').write({'updated_in_shopify': True})
@@ -1056,32 +1231,51 @@ class SaleOrder(models.Model):
                             "notify_customer": notify_customer}
         return fulfillment_vals
 
-    def post_fulfilment_in_shopify(self, fulfillment_vals, sale_order, log_book):
-        """ This method is used to post the fulfillment from Odoo to Shopify store.
-            @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 10 November 2020 .
-            Task_id: 167930 - Update order status changes as per v13
-        """
-        try:
-            new_fulfillment = shopify.Fulfillment(fulfillment_vals)
-            fulfillment_result = new_fulfillment.save()
-            if not fulfillment_result:
-                return False, fulfillment_result, new_fulfillment
-        except ClientError as error:
-            if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                    fulfillment_result = new_fulfillment.save()
-        except Exception as error:
-            message = "%s" % str(error)
-            _logger.info(message)
-            self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
-            return True, fulfillment_result, new_fulfillment
-
-        return False, fulfillment_result, new_fulfillment
+    def post_fulfilments_in_shopify(self, instance, fulfillments, log_book):
+        """
+        This method posts the prepared fulfillments to Shopify concurrently, with a few requests at a time to stay
+        within the API limit of the shop. The results are written back to the pickings together.
+        @param instance: Record of Shopify instance.
+        @param fulfillments: List of dictionaries of picking, sale order, order response, Shopify location and
+        fulfillment values.
+        @param log_book: Record of log book.
+        """
+        shop_url = instance.prepare_shopify_shop_url(instance.shopify_host, instance.shopify_api_key,
+                                                     instance.shopify_password)
+        bucket_key = instance.get_api_bucket_key_ept()
+        workers = min(FULFILLMENT_POST_WORKERS, len(fulfillments))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda fulfillment: _post_fulfillment(shop_url, bucket_key, fulfillment[
+                "fulfillment_vals"], workers), fulfillments))
+
+        fulfillment_ids = {}
+        orders_by_location = {}
+        for fulfillment, (fulfillment_result, new_fulfillment, error) in zip(fulfillments, results):
+            sale_order = fulfillment["sale_order"]
+            if error:
+                _logger.info(error)
+                self.create_shopify_log_line(error, False, log_book, sale_order.client_order_ref)
+                continue
+            fulfillment_id = self.process_shopify_fulfilment_result(fulfillment_result, fulfillment["order_response"],
+                                                                    fulfillment["picking"], sale_order, log_book,
+                                                                    new_fulfillment)
+            if fulfillment_id is not False:
+                fulfillment_ids[fulfillment["picking"].id] = fulfillment_id
+            orders_by_location.setdefault(fulfillment["shopify_location"], self.browse())
+            orders_by_location[fulfillment["shopify_location"]] |= sale_order
+
+        for picking_id, fulfillment_id in fulfillment_ids.items():
+            self.env["stock.picking"].browse(picking_id).write({"updated_in_shopify": True,
+                                                                "shopify_fulfillment_id": fulfillment_id})
+        for shopify_location, sale_orders in orders_by_location.items():
+            sale_orders.write({"shopify_location_id": shopify_location.id})
+        return True
 
     def process_shopify_fulfilment_result(self, fulfillment_result, order_response, picking, sale_order, log_book,
                                           new_fulfillment):
-        """ This method is used to process fulfillment result.
+        """ This method is used to process fulfillment result. The successful result is written to the picking by
+            the caller, along with the other pickings of the batch.
+            @return: Id of the fulfillment or False, when the fulfillment is not created.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 10 November 2020 .
             Task_id:167930 - Update order status changes as per v13
         """
@@ -1098,15 +1292,8 @@ class SaleOrder(models.Model):
             self.create_shopify_log_line(message, False, log_book, sale_order.client_order_ref)
             return False
 
-        fulfillment_id = ''
-        if new_fulfillment:
-            shopify_fullment_result = xml_to_dict(new_fulfillment.to_xml())
-            if shopify_fullment_result:
-                fulfillment_id = shopify_fullment_result.get('fulfillment').get('id') or ''
-
-        picking.write({'updated_in_shopify': True, 'shopify_fulfillment_id': fulfillment_id})
-
-        return True
+        fulfillment_id = new_fulfillment and new_fulfillment.attributes.get('id') or ''
+        return str(fulfillment_id)
 
     @api.model
     def process_shopify_order_via_webhook(self, order_data, instance, update_order=False):
@@ -1456,11 +1643,14 @@ class SaleOrder(models.Model):
             :param order_response: Response of shopify order.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 31 December 2020 .
             Task_id: 169381 - Gift card order import changes
+            All the moves of the order are created together and validated with a single _action_done.
         """
         module_obj = self.env['ir.module.module']
-        mrp_module = module_obj.sudo().search([('name', '=', 'mrp'), ('state', '=', 'installed')])
+        stock_location_obj = self.env["stock.location"]
+        mrp_module = module_obj.is_module_installed_ept('mrp')
+        customer_location = stock_location_obj.search([("usage", "=", "customer")], limit=1)
         lines = order_response.get("line_items")
-        bom_lines = []
+        move_vals_list = []
         for line in lines:
             shopify_line_id = line.get('id')
             sale_order_line = self.order_line.filtered(lambda order_line: int(order_line.shopify_line_id)
@@ -1469,12 +1659,16 @@ class SaleOrder(models.Model):
             if not sale_order_line:
                 continue
             fulfilled_qty = float(line.get('quantity')) - float(line.get('fulfillable_quantity'))
+            bom_lines = []
             if mrp_module:
                 bom_lines = self.check_for_bom_product(sale_order_line.product_id)
             for bom_line in bom_lines:
-                self.create_stock_move_of_fullfield_qty(sale_order_line, fulfilled_qty, bom_line)
-            if fulfilled_qty > 0 and not mrp_module:
-                self.create_stock_move_of_fullfield_qty(sale_order_line, fulfilled_qty)
+                move_vals_list.append(self.prepare_stock_move_vals_of_fullfield_qty(sale_order_line, fulfilled_qty,
+                                                                                    customer_location, bom_line))
+            if fulfilled_qty > 0 and not bom_lines:
+                move_vals_list.append(self.prepare_stock_move_vals_of_fullfield_qty(sale_order_line, fulfilled_qty,
+                                                                                    customer_location))
+        self.create_and_done_stock_moves_ept([vals for vals in move_vals_list if vals])
         return True
 
     def create_stock_move_of_fullfield_qty(self, order_line, fulfilled_qty, bom_line=False):
@@ -1487,6 +1681,19 @@ class SaleOrder(models.Model):
         """
         stock_location_obj = self.env["stock.location"]
         customer_location = stock_location_obj.search([("usage", "=", "customer")], limit=1)
+        move_vals = self.prepare_stock_move_vals_of_fullfield_qty(order_line, fulfilled_qty, customer_location,
+                                                                  bom_line)
+        self.create_and_done_stock_moves_ept([move_vals] if move_vals else [])
+        return True
+
+    def prepare_stock_move_vals_of_fullfield_qty(self, order_line, fulfilled_qty, customer_location, bom_line=False):
+        """ This method is used to prepare the vals of stock move for the fulfilled qty of the order line.
+            :param order_line: Record of sale order line
+            :param fulfilled_qty: Qty of product which needs to create a stock move.
+            :param customer_location: Record of customer location.
+            :param bom_line: Exploded BoM line
+            @return: Dictionary of stock move vals or empty dictionary.
+        """
         if bom_line:
             product = bom_line[0].product_id
             product_qty = bom_line[1].get('qty', 0) * fulfilled_qty
@@ -1495,16 +1702,12 @@ class SaleOrder(models.Model):
             product = order_line.product_id
             product_qty = fulfilled_qty
             product_uom = order_line.product_uom
-        if product and product_qty and product_uom:
-            move_vals = self.prepare_val_for_stock_move(product, product_qty, product_uom, customer_location,
-                                                        order_line)
-            if bom_line:
-                move_vals.update({'bom_line_id': bom_line[0].id})
-            stock_move = self.env['stock.move'].create(move_vals)
-            stock_move._action_assign()
-            stock_move._set_quantity_done(fulfilled_qty)
-            stock_move._action_done()
-        return True
+        if not (product and product_qty and product_uom):
+            return {}
+        move_vals = self.prepare_val_for_stock_move(product, product_qty, product_uom, customer_location, order_line)
+        if bom_line:
+            move_vals.update({'bom_line_id': bom_line[0].id})
+        return move_vals
 
     def prepare_val_for_stock_move(self, product, fulfilled_qty, product_uom, customer_location, order_line):
         """ Prepare vals for the stock move.
@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-import json
 import logging
 import time
 from datetime import datetime
 
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from odoo.tools.misc import split_every
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ClientError
 
@@ -652,13 +652,17 @@ class ShopifyProductProductEpt(models.Model):
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
         product_obj = self.env["product.product"]
+        stock_export_ledger_obj = self.env["shopify.stock.export.ledger.ept"]
 
         log_line_array = []
         model = "shopify.product.product.ept"
         model_id = common_log_line_obj.get_model_id(model)
         all_products = self.search_shopify_product_for_export_stock(instance, product_ids)
+        # Stock of the selected products is always exported, otherwise only the changed quantities are exported.
+        is_force_export = self._context.get('is_process_from_selected_product')
 
-        if self._context.get('is_process_from_selected_product'):
+        if self._context.get('is_process_from_selected_product') or \
+                self._context.get('is_process_from_stock_change'):
             shopify_products = all_products
         else:
             if instance.shopify_last_date_update_stock:
@@ -680,6 +684,20 @@ class ShopifyProductProductEpt(models.Model):
             message = "Location not found for instance %s while update stock" % instance.name
             log_line_array = self.shopify_create_log(message, model_id, False, log_line_array)
 
+        exportable_products = self
+        for shopify_product in shopify_products.filtered(lambda x: x.product_id.type == "product"):
+            if not shopify_product.inventory_item_id:
+                message = "Inventory Item Id did not found for Shopify Product Variant ID " \
+                          "%s with name %s for instance %s while Export stock" % (
+                              shopify_product.id, shopify_product.name, instance.name)
+                log_line_array = self.shopify_create_log(message, model_id, shopify_product.product_id,
+                                                         log_line_array)
+                continue
+            exportable_products |= shopify_product
+
+        # Locations with the same warehouses have the same stock, so it is computed once for them.
+        quantities_by_warehouses = {}
+        failed_products = self
         for location_id in location_ids:
             shopify_location_warehouse = location_id.export_stock_warehouse_ids or False
             if not shopify_location_warehouse:
@@ -687,75 +705,128 @@ class ShopifyProductProductEpt(models.Model):
                 log_line_array = self.shopify_create_log(message, model_id, False, log_line_array)
                 continue
 
-            odoo_product_ids = shopify_products.product_id.ids
-            product_stock = self.check_stock(instance, odoo_product_ids, product_obj,
-                                             location_id.export_stock_warehouse_ids)
-            commit_count = 0
-            for shopify_product in shopify_products:
-                if commit_count == 50:
-                    self._cr.commit()
-                    commit_count = 0
-                commit_count += 1
-                odoo_product = shopify_product.product_id
-                if odoo_product.type == "product":
-                    if not shopify_product.inventory_item_id:
-                        message = "Inventory Item Id did not found for Shopify Product Variant ID " \
-                                  "%s with name %s for instance %s while Export stock" % (
-                                      shopify_product.id, shopify_product.name, instance.name)
-                        log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
-                        continue
-
-                    quantity = self.compute_qty_for_export_stock(product_stock, shopify_product, odoo_product)
-                    try:
-                        shopify.InventoryLevel.set(location_id.shopify_location_id, shopify_product.inventory_item_id,
-                                                   int(quantity))
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                shopify.InventoryLevel.set(location_id.shopify_location_id,
-                                                           shopify_product.inventory_item_id,
-                                                           int(quantity))
-                                continue
-                            message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance:" \
-                                      "'%s'\nError: %s\n%s" % (odoo_product.id, odoo_product.name, instance.name,
-                                                               str(error.response.code) + " " + error.response.msg,
-                                                               json.loads(error.response.body.decode()).get("errors")[0]
-                                                               )
-                            log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
-
-                    except Exception as error:
-                        message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance: " \
-                                  "'%s'\nError: %s" % (odoo_product.id, odoo_product.name, instance.name, str(error))
-                        log_line_array = self.shopify_create_log(message, model_id, odoo_product, log_line_array)
-
-                    if not self._context.get('is_process_from_selected_product'):
-                        shopify_product.write({
-                            'last_stock_update_date': last_export_date if not shopify_product.last_stock_update_date else datetime.now()})
+            warehouse_key = tuple(sorted(shopify_location_warehouse.ids))
+            if warehouse_key not in quantities_by_warehouses:
+                product_stock = self.check_stock(instance, exportable_products.product_id.ids, product_obj,
+                                                 shopify_location_warehouse)
+                quantities_by_warehouses[warehouse_key] = exportable_products.compute_qty_for_export_stock(
+                    product_stock)
+            export_quantities = quantities_by_warehouses[warehouse_key]
+
+            last_pushed_quantities = stock_export_ledger_obj.get_last_pushed_quantities(instance, location_id)
+            changed_stock = [(shopify_product, export_quantities[shopify_product.id]) for shopify_product in
+                             exportable_products if is_force_export or
+                             last_pushed_quantities.get(shopify_product.inventory_item_id) !=
+                             export_quantities[shopify_product.id]]
+
+            for stock_batch in split_every(shopify.InventoryLevel.MAX_SET_QUANTITIES, changed_stock):
+                log_line_array, failed_batch_products = self.set_stock_quantities_in_shopify(
+                    instance, location_id, stock_batch, model_id, log_line_array)
+                failed_products |= failed_batch_products
+                self._cr.commit()
+
+        if quantities_by_warehouses and not is_force_export:
+            undated_products = exportable_products.filtered(lambda x: not x.last_stock_update_date)
+            (exportable_products - undated_products).write({'last_stock_update_date': datetime.now()})
+            undated_products.write({'last_stock_update_date': last_export_date})
+
+        if failed_products:
+            # The stock of these products is exported again by the next run of the stock export cron.
+            self.env["product.stock.change.ept"].mark_products_changed_ept(
+                failed_products.product_id.ids, instance.shopify_company_id.id, [instance.get_stock_change_key_ept()],
+                notify=False)
 
         if len(log_line_array) > 0:
             self.create_log_book(log_line_array, "export", instance)
 
         return all_products
 
-    def compute_qty_for_export_stock(self, product_stock, shopify_product, odoo_product):
-        """ This method is used to find qty base on the configuration of Shopify.
+    def set_stock_quantities_in_shopify(self, instance, location, stock_batch, model_id, log_line_array):
+        """
+        This method sets the stock of many products at the Shopify location with one GraphQL mutation. When Shopify
+        rejects some of the quantities, the others are sent again without them. The exported quantities are saved in
+        the stock export ledger.
+        @param location: Record of Shopify location.
+        @param stock_batch: List of tuples of Shopify product and quantity.
+        @param log_line_array: List of log line values.
+        @return: List of log line values, records of Shopify products whose stock is not exported.
+        """
+        failed_products = self
+        errors = self.request_set_stock_quantities(instance, location, stock_batch)
+        if errors and None not in errors:
+            for index, error in errors.items():
+                failed_products |= stock_batch[index][0]
+                log_line_array = self.prepare_export_stock_error_log(instance, stock_batch[index][0], error, model_id,
+                                                                     log_line_array)
+            stock_batch = [stock for index, stock in enumerate(stock_batch) if index not in errors]
+            errors = stock_batch and self.request_set_stock_quantities(instance, location, stock_batch) or {}
+
+        if errors:
+            for index, (shopify_product, quantity) in enumerate(stock_batch):
+                failed_products |= shopify_product
+                log_line_array = self.prepare_export_stock_error_log(instance, shopify_product,
+                                                                     errors.get(index) or errors.get(None), model_id,
+                                                                     log_line_array)
+            return log_line_array, failed_products
+
+        pushed_quantities = {shopify_product.inventory_item_id: quantity for shopify_product, quantity in stock_batch}
+        self.env["shopify.stock.export.ledger.ept"].save_pushed_quantities(instance, location, pushed_quantities)
+        return log_line_array, failed_products
+
+    def request_set_stock_quantities(self, instance, location, stock_batch):
+        """
+        This method sends the inventorySetQuantities mutation for the stock of the products. A throttled request is
+        sent again once, after the bucket has restored the cost of the request.
+        @param location: Record of Shopify location.
+        @param stock_batch: List of tuples of Shopify product and quantity.
+        @return: Dictionary of index of the stock in the batch and its error. Index None is for the whole batch.
+        """
+        inventory_level = shopify.InventoryLevel
+        query, variables = inventory_level.prepare_set_quantities(
+            location.shopify_location_id, [(shopify_product.inventory_item_id, quantity) for shopify_product, quantity in
+                                           stock_batch])
+        try:
+            response = instance.shopify_graphql_request_ept(query, variables)
+            if any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in
+                   response.get("errors") or []):
+                cost = response.get("extensions", {}).get("cost", {})
+                throttle_status = cost.get("throttleStatus", {})
+                # Only the missing cost of this request is waited for, not the whole bucket.
+                missing_cost = cost.get("requestedQueryCost", 0) - throttle_status.get("currentlyAvailable", 0)
+                time.sleep(max(missing_cost, 0) / (throttle_status.get("restoreRate") or 50) + 1)
+                response = instance.shopify_graphql_request_ept(query, variables)
+        except Exception as error:
+            return {None: str(error)}
+        return inventory_level.parse_set_quantities_errors(response, len(stock_batch))
+
+    def prepare_export_stock_error_log(self, instance, shopify_product, error, model_id, log_line_array):
+        """
+        This method prepares the log line of the product, whose stock could not be exported.
+        @return: List of log line values.
+        """
+        odoo_product = shopify_product.product_id
+        message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance: '%s'\nError: %s" % (
+            odoo_product.id, odoo_product.name, instance.name, error)
+        return self.shopify_create_log(message, model_id, odoo_product, log_line_array)
+
+    def compute_qty_for_export_stock(self, product_stock):
+        """ This method is used to find qty of all the Shopify products base on the configuration of Shopify. The
+            fix and percentage rules are applied on the stock of all the products at once.
             :param product_stock: Dictionary of the odoo product with qty.
-            :param shopify_product: Record of shopify product product.
-            :param odoo_product: Record of odoo product.
+            @return: Dictionary of the Shopify product id with qty.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 30 October 2020 .
             Task_id:167537
         """
-        quantity = product_stock.get(odoo_product.id, 0)
-        if shopify_product.fix_stock_type == 'fix':
-            if shopify_product.fix_stock_value < quantity:
-                quantity = shopify_product.fix_stock_value
-        elif shopify_product.fix_stock_type == 'percentage':
-            percentage_stock = int((quantity * shopify_product.fix_stock_value) / 100.0)
-            if percentage_stock < quantity:
-                quantity = percentage_stock
+        export_quantities = {}
+        for product_data in self.read(["product_id", "fix_stock_type", "fix_stock_value"], load=False):
+            quantity = product_stock.get(product_data["product_id"], 0)
+            if product_data["fix_stock_type"] == 'fix':
+                quantity = min(quantity, product_data["fix_stock_value"])
+            elif product_data["fix_stock_type"] == 'percentage':
+                quantity = min(quantity, int((quantity * product_data["fix_stock_value"]) / 100.0))
+            export_quantities[product_data["id"]] = int(quantity)
 
-        return quantity
+        return export_quantities
 
     def search_shopify_product_for_export_stock(self, instance, product_ids):
         """ This method is used to search shopify product for export stock.
@@ -805,6 +876,8 @@ class ShopifyProductProductEpt(models.Model):
 
         templates = self.search([("shopify_instance_id", "=", instance.id), ("exported_in_shopify", "=", True)])
         if templates:
+            # The stock of Shopify may be changed outside of the export, so the next export sends all quantities.
+            self.env["shopify.stock.export.ledger.ept"].clear_pushed_quantities(instance)
             instance.connect_in_shopify()
             location_ids = self.search_shopify_location_for_import_stock(instance, model_id, log_line_array)
             if not location_ids:
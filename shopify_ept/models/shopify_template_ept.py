@@ -201,6 +201,60 @@ class ShopifyProductTemplateEpt(models.Model):
 
         return result
 
+    def import_products_for_orders(self, template_ids, instance, log_book_id):
+        """
+        Fetches the products, which are not found while processing the orders, with one request per 250 products and
+        syncs them, so the orders do not request their missing products one by one.
+        @param template_ids: Ids of Shopify templates.
+        @param instance: Shopify Instance.
+        @param log_book_id: Common Log Book.
+        @return: Dictionary of template id and its data. Data is False for the products, which are not received.
+        """
+        common_log_line_obj = self.env["common.log.lines.ept"]
+        model_id = common_log_line_obj.get_model_id("shopify.product.template.ept")
+        template_ids = list(set(str(template_id) for template_id in template_ids))
+        templates_data = dict.fromkeys(template_ids, False)
+        if not template_ids:
+            return templates_data
+
+        instance.connect_in_shopify()
+        for index in range(0, len(template_ids), 250):
+            results = self.request_for_shopify_templates(template_ids[index:index + 250], model_id, log_book_id)
+            for result in results:
+                template_data = result.to_dict()
+                templates_data.update({str(template_data.get("id")): template_data})
+                self.shopify_sync_products(False, template_data.get("id"), instance, log_book_id,
+                                           template_data=template_data)
+        _logger.info("Imported %s missing product(s) of the orders.", len([data for data in templates_data.values()
+                                                                           if data]))
+        return templates_data
+
+    def request_for_shopify_templates(self, template_ids, model_id, log_book_id):
+        """
+        Requests multiple Shopify products at once by their ids.
+        @param template_ids: List of Shopify template ids, maximum 250.
+        @return: List of product responses.
+        """
+        common_log_line_obj = self.env["common.log.lines.ept"]
+        results = []
+        try:
+            results = shopify.Product().find(ids=",".join(template_ids), limit=250)
+        except ClientError as error:
+            if hasattr(error, "response"):
+                if error.response.code == 429 and error.response.msg == "Too Many Requests":
+                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
+                    results = shopify.Product().find(ids=",".join(template_ids), limit=250)
+                    return results
+                message = "Error while importing products for orders. Product IDs: %s.\nError: %s" % (
+                    ",".join(template_ids), str(error.response.code) + " " + error.response.msg)
+                common_log_line_obj.shopify_create_order_log_line(message, model_id, False, log_book_id)
+        except Exception as error:
+            message = "Error while importing products for orders. Product IDs: %s.\nError: %s" % (
+                ",".join(template_ids), str(error))
+            common_log_line_obj.shopify_create_order_log_line(message, model_id, False, log_book_id)
+
+        return results or []
+
     def prepare_variant_vals(self, instance, variant_data):
         """
         This method used to prepare a shopify variant dictionary.
@@ -274,7 +328,7 @@ class ShopifyProductTemplateEpt(models.Model):
         return product_category
 
     def shopify_sync_products(self, product_data_line_id, shopify_tmpl_id, instance, log_book_id,
-                              order_data_line_id=False):
+                              order_data_line_id=False, template_data=False):
         """
         This method is used to sync products from queue line or shopify template id for Order.
         @param product_data_line_id: Product Queue Line.
@@ -283,6 +337,7 @@ class ShopifyProductTemplateEpt(models.Model):
         @param instance: Shopify Instance.
         @param log_book_id: Common Log Book.
         @param order_data_line_id: Order Queue Line, when needed to import a product for a order.
+        @param template_data: Already received data of the Shopify template, so it is not requested again.
         @author: Maulik Barad on Date 01-Sep-2020.
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
@@ -290,9 +345,13 @@ class ShopifyProductTemplateEpt(models.Model):
         model_id = common_log_line_obj.get_model_id("shopify.product.template.ept")
         instance.connect_in_shopify()
 
-        template_data, skip_existing_product = self.convert_shopify_template_response(shopify_tmpl_id,
-                                                                                      product_data_line_id, model_id,
-                                                                                      log_book_id, order_data_line_id)
+        if template_data:
+            skip_existing_product = False
+        else:
+            template_data, skip_existing_product = self.convert_shopify_template_response(shopify_tmpl_id,
+                                                                                          product_data_line_id,
+                                                                                          model_id, log_book_id,
+                                                                                          order_data_line_id)
 
         if not template_data:
             return True
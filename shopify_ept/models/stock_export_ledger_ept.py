@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, fields
+
+
+class ShopifyStockExportLedgerEpt(models.Model):
+    _name = "shopify.stock.export.ledger.ept"
+    _description = "Shopify Stock Export Ledger"
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", index=True)
+    shopify_location_id = fields.Many2one("shopify.location.ept", string="Location", required=True,
+                                          ondelete="cascade")
+    inventory_item_id = fields.Char(required=True)
+    quantity = fields.Integer(help="Last quantity exported to Shopify.")
+    pushed_at = fields.Datetime(help="Date on which the quantity is exported.")
+
+    _sql_constraints = [("unique_location_inventory_item",
+                         "unique(shopify_instance_id,shopify_location_id,inventory_item_id)",
+                         "Ledger must be unique per instance, location and inventory item.")]
+
+    def get_last_pushed_quantities(self, instance, location):
+        """
+        This method gives the last exported quantity of each inventory item of the location.
+        @param instance: Record of Shopify instance.
+        @param location: Record of Shopify location.
+        @return: Dictionary of inventory item id and quantity.
+        """
+        self._cr.execute("""SELECT inventory_item_id, quantity FROM shopify_stock_export_ledger_ept
+            WHERE shopify_instance_id = %s AND shopify_location_id = %s""", (instance.id, location.id))
+        return dict(self._cr.fetchall())
+
+    def save_pushed_quantities(self, instance, location, quantities):
+        """
+        This method saves the exported quantities of the location in one query. The existing quantities of the
+        inventory items are replaced.
+        @param instance: Record of Shopify instance.
+        @param location: Record of Shopify location.
+        @param quantities: Dictionary of inventory item id and exported quantity.
+        """
+        if not quantities:
+            return True
+        self._cr.execute("""INSERT INTO shopify_stock_export_ledger_ept
+            (shopify_instance_id, shopify_location_id, inventory_item_id, quantity, pushed_at, create_uid, create_date,
+             write_uid, write_date)
+            SELECT %s, %s, item.inventory_item_id, item.quantity, now() at time zone 'UTC', %s,
+                   now() at time zone 'UTC', %s, now() at time zone 'UTC'
+            FROM unnest(%s, %s) AS item(inventory_item_id, quantity)
+            ON CONFLICT (shopify_instance_id, shopify_location_id, inventory_item_id)
+            DO UPDATE SET quantity = EXCLUDED.quantity, pushed_at = EXCLUDED.pushed_at, write_uid = EXCLUDED.write_uid,
+                          write_date = EXCLUDED.write_date""",
+                         (instance.id, location.id, self.env.uid, self.env.uid, list(quantities),
+                          [int(quantity) for quantity in quantities.values()]))
+        return True
+
+    def clear_pushed_quantities(self, instance):
+        """
+        This method removes the exported quantities of the instance, so the next export sends all the quantities.
+        It is needed when the stock in Shopify is changed outside of the export.
+        @param instance: Record of Shopify instance.
+        """
+        self._cr.execute("DELETE FROM shopify_stock_export_ledger_ept WHERE shopify_instance_id = %s", (instance.id,))
+        return True
@@ -51,6 +51,7 @@ class ShopifyWebhookEpt(models.Model):
                     raise UserError(_("Something went wrong while deleting the webhook."))
             _logger.info("Deleted %s webhook from Odoo.", record.webhook_action)
         unlink_main = super(ShopifyWebhookEpt, self).unlink()
+        self.clear_caches()
         self.deactivate_auto_create_webhook(instance)
         return unlink_main
 
@@ -93,8 +94,18 @@ class ShopifyWebhookEpt(models.Model):
 
         result = super(ShopifyWebhookEpt, self).create(values)
         result.get_webhook()
+        self.clear_caches()
         return result
 
+    def write(self, vals):
+        """
+        Inherited for clearing the webhook routing table of the instances, when the fields used in it are changed.
+        """
+        res = super(ShopifyWebhookEpt, self).write(vals)
+        if {"state", "delivery_url", "instance_id"}.intersection(vals):
+            self.clear_caches()
+        return res
+
     def get_route(self):
         """
         Gives delivery URL for the webhook as per the Webhook Action.
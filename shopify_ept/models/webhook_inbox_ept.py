@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger("Shopify Webhook Inbox")
+
+# Fields which change on every delivery, even when nothing else is changed.
+VOLATILE_PAYLOAD_FIELDS = ["updated_at"]
+# Attempts to process a webhook request, retried with exponential backoff after a failure.
+MAX_WEBHOOK_ATTEMPTS = 5
+
+
+class WebhookDeliveryCache(object):
+    """
+    Bounded LRU of the webhook ids seen by this worker. It is checked before the database, so redelivered webhooks
+    are dropped without any query. Only the ids are kept, as a delivery id never gets another meaning, while the
+    last payload of a record may be changed by a request stored in another worker.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+webhook_delivery_cache = WebhookDeliveryCache()
+
+
+class ShopifyWebhookInboxEpt(models.Model):
+    _name = "shopify.webhook.inbox.ept"
+    _description = "Shopify Webhook Inbox"
+    _order = "id"
+
+    route = fields.Char(index=True)
+    shop_domain = fields.Char()
+    webhook_id = fields.Char(index=True, help="Id of the webhook delivery given by Shopify.")
+    resource_key = fields.Char(index=True, help="Shop domain, route and id of the record of the webhook.")
+    payload_hash = fields.Char(help="Hash of the payload without the fields changing on every delivery.")
+    headers = fields.Text(help="Shopify headers of the request in JSON.")
+    body = fields.Text(help="Raw body of the request.")
+    state = fields.Selection([("draft", "Draft"), ("done", "Done"), ("failed", "Failed")], default="draft",
+                             index=True)
+    message = fields.Text()
+    processed_at = fields.Datetime()
+    attempt_count = fields.Integer(help="Number of failed attempts to process the request.")
+    next_attempt_at = fields.Datetime(help="Date after which the failed request is processed again.")
+
+    @api.model
+    def store_webhook_request(self, route, headers, body):
+        """
+        This method stores the webhook request as it is received, so the request can be acknowledged without
+        processing it.
+        @param route: Route of the webhook.
+        @param headers: Headers of the request.
+        @param body: Raw body of the request.
+        @return: Record of inbox or False, when the request is a duplicate or the webhook is not active.
+        """
+        shop_domain = headers.get("X-Shopify-Shop-Domain")
+        if not self.env["shopify.instance.ept"].get_webhook_route_ept(shop_domain, route):
+            _logger.info("%s call of %s is skipped as the instance or the webhook is not active.", route,
+                         shop_domain)
+            return False
+        webhook_id = headers.get("X-Shopify-Webhook-Id")
+        payload = json.loads(body or "{}")
+        resource_key = "%s|%s|%s" % (shop_domain, route, payload.get("id"))
+        payload_hash = self.prepare_payload_hash(payload)
+        if self.is_duplicate_webhook(webhook_id, resource_key, payload_hash):
+            _logger.info("Duplicate %s call for %s is skipped.", route, resource_key)
+            return False
+
+        shopify_headers = {key: value for key, value in headers.items() if key.lower().startswith("x-shopify")}
+        inbox = self.create({"route": route,
+                             "shop_domain": shop_domain,
+                             "webhook_id": webhook_id,
+                             "resource_key": resource_key,
+                             "payload_hash": payload_hash,
+                             "headers": json.dumps(shopify_headers),
+                             "body": body})
+        # The cache is filled only when the inbox is committed, so a rolled back request is not taken as received.
+        dbname = self._cr.dbname
+
+        def cache_webhook_delivery():
+            webhook_delivery_cache.set((dbname, webhook_id), True)
+
+        if webhook_id:
+            self._cr.postcommit.add(cache_webhook_delivery)
+        return inbox
+
+    def prepare_payload_hash(self, payload):
+        """
+        This method prepares the hash of the payload without the fields which change on every delivery, so an
+        update without any real change gives the same hash as the previous delivery.
+        @param payload: Dictionary of the payload.
+        @return: Hash of the payload.
+        """
+        relevant_payload = {key: value for key, value in payload.items() if key not in VOLATILE_PAYLOAD_FIELDS}
+        return hashlib.sha256(json.dumps(relevant_payload, sort_keys=True).encode()).hexdigest()
+
+    def is_duplicate_webhook(self, webhook_id, resource_key, payload_hash):
+        """
+        This method checks whether the webhook delivery is already received, or the payload is the same as the last
+        received payload of the record. The delivery id is checked in the cache of the worker first, the payload is
+        always compared with the last request of the record in the inbox.
+        @param webhook_id: Id of the webhook delivery.
+        @param resource_key: Shop domain, route and id of the record.
+        @param payload_hash: Hash of the payload.
+        @return: True, when the webhook is a duplicate.
+        """
+        dbname = self._cr.dbname
+        if webhook_id:
+            if webhook_delivery_cache.get((dbname, webhook_id)):
+                return True
+            if self.search_count([("webhook_id", "=", webhook_id)]):
+                webhook_delivery_cache.set((dbname, webhook_id), True)
+                return True
+        last_inbox = self.search_read([("resource_key", "=", resource_key)], ["payload_hash"], order="id desc",
+                                      limit=1)
+        return bool(last_inbox and last_inbox[0]["payload_hash"] == payload_hash)
+
+    def get_webhook_instance(self):
+        """
+        This method gives the instance of the webhook, when the instance and the webhook of the route are active.
+        @return: Record of instance or False.
+        """
+        instance_id = self.env["shopify.instance.ept"].get_webhook_route_ept(self.shop_domain, self.route)
+        if not instance_id:
+            _logger.info("The method is skipped. It appears the instance of %s is not active or that "
+                         "the webhook %s is not active.", self.shop_domain, self.route)
+            return False
+        return self.env["shopify.instance.ept"].browse(instance_id)
+
+    def get_pending_webhook_domain(self):
+        """
+        This method gives the domain of the requests to process, the new ones and the failed ones, which are due
+        for another attempt.
+        @return: Domain.
+        """
+        return ["|", ("state", "=", "draft"),
+                "&", "&", ("state", "=", "failed"), ("attempt_count", "<", MAX_WEBHOOK_ATTEMPTS),
+                ("next_attempt_at", "<=", datetime.now())]
+
+    @api.model
+    def process_webhook_inbox(self, batch_size=200, time_limit=50):
+        """
+        This method is called by cron to process the stored webhook requests in batches, until no request is left
+        or the time is over. New orders of a batch are imported together per instance, other requests are processed
+        one by one.
+        @param batch_size: Number of requests processed in one batch.
+        @param time_limit: Seconds to process the requests.
+        """
+        start = time.time()
+        self.search([("state", "=", "done"), ("processed_at", "<", datetime.now() - timedelta(days=7))]).unlink()
+        self._cr.commit()
+        seen_ids = []
+        while time.time() - start < time_limit:
+            inbox_records = self.search(self.get_pending_webhook_domain() + [("id", "not in", seen_ids)],
+                                        limit=batch_size)
+            if not inbox_records:
+                break
+            seen_ids += inbox_records.ids
+            inbox_records = self.coalesce_webhook_requests(inbox_records)
+            seen_ids += inbox_records.ids
+            self._cr.commit()
+            self.process_webhook_batch(inbox_records)
+        return True
+
+    def process_webhook_batch(self, inbox_records):
+        """
+        This method processes a batch of webhook requests. The result of each request is committed separately.
+        @param inbox_records: Requests to process.
+        """
+        new_orders = {}
+        for inbox in inbox_records:
+            try:
+                instance = inbox.get_webhook_instance()
+                if not instance:
+                    inbox.write({"state": "done", "processed_at": datetime.now(),
+                                 "message": "Instance or webhook is not active."})
+                    continue
+                data = json.loads(inbox.body)
+                if inbox.route == "shopify_odoo_webhook_for_orders_partially_updated":
+                    new_order_data = inbox.process_order_webhook(data, instance)
+                    if new_order_data:
+                        new_orders.setdefault(instance, []).append((inbox, new_order_data))
+                        continue
+                elif inbox.route in ["shopify_odoo_webhook_for_product_update",
+                                     "shopify_odoo_webhook_for_product_delete"]:
+                    inbox.process_product_webhook(data, instance)
+                else:
+                    _logger.info("%s call for Customer: %s", inbox.route, data.get("id"))
+                    self.env["shopify.process.import.export"].webhook_customer_create_process(data, instance)
+                inbox.write({"state": "done", "processed_at": datetime.now()})
+            except Exception as error:
+                self._cr.rollback()
+                inbox.set_webhook_failed(str(error))
+                _logger.exception("Webhook request %s could not be processed.", inbox.id)
+            self._cr.commit()
+
+        order_data_queue_obj = self.env["shopify.order.data.queue.ept"]
+        for instance, order_requests in new_orders.items():
+            orders = [order_data for inbox, order_data in order_requests]
+            error_message = "The order is not imported, please check the log of the order import."
+            try:
+                order_data_queue_obj.process_shopify_orders_directly(orders, instance)
+            except Exception as error:
+                self._cr.rollback()
+                error_message = str(error)
+                _logger.exception("New orders of webhook could not be imported for instance %s.", instance.name)
+            # The orders are committed in parts while importing, so each request is marked by its own order.
+            imported_order_ids = order_data_queue_obj.get_imported_shopify_order_ids(instance, orders)
+            for inbox, order_data in order_requests:
+                if str(order_data.get("id")) in imported_order_ids:
+                    inbox.write({"state": "done", "processed_at": datetime.now()})
+                else:
+                    inbox.set_webhook_failed(error_message)
+            self._cr.commit()
+        return True
+
+    def set_webhook_failed(self, message):
+        """
+        This method counts the failed attempt of the request. It is processed again after a delay growing with
+        each attempt, until the attempts are over.
+        @param message: Error of the attempt.
+        """
+        attempt_count = self.attempt_count + 1
+        self.write({"state": "failed",
+                    "processed_at": datetime.now(),
+                    "message": message,
+                    "attempt_count": attempt_count,
+                    "next_attempt_at": datetime.now() + timedelta(seconds=60 * 2 ** attempt_count)})
+        return True
+
+    def coalesce_webhook_requests(self, inbox_records):
+        """
+        This method keeps only the latest request of each record, as every webhook carries the full data of the
+        record. The older requests are marked as done. When the latest request of a record is received within the
+        coalesce window of the instance, the record is left for the next run, as more updates may follow.
+        @param inbox_records: Pending requests of the batch.
+        @return: Requests to process.
+        """
+        routing_table = self.env["shopify.instance.ept"].get_webhook_routing_table_ept()
+        resource_keys = list(set(inbox_records.mapped("resource_key")))
+        # Requests of the same records, which are received after the batch, are taken in the group as well.
+        inbox_records |= self.search(self.get_pending_webhook_domain() + [("resource_key", "in", resource_keys)])
+        groups = {}
+        for inbox in inbox_records.sorted("id"):
+            groups.setdefault(inbox.resource_key, self.browse())
+            groups[inbox.resource_key] |= inbox
+
+        requests_to_process = self.browse()
+        for inbox_group in groups.values():
+            latest_inbox = inbox_group[-1]
+            route_info = routing_table.get((latest_inbox.shop_domain or "").lower(), {})
+            coalesce_seconds = route_info.get("coalesce_seconds", 0)
+            if latest_inbox.create_date > datetime.now() - timedelta(seconds=coalesce_seconds):
+                continue
+            superseded_inbox = inbox_group - latest_inbox
+            if superseded_inbox:
+                superseded_inbox.write({"state": "done", "processed_at": datetime.now(),
+                                        "message": "Superseded by webhook request %s." % latest_inbox.id})
+            requests_to_process |= latest_inbox
+        return requests_to_process.sorted("id")
+
+    def process_order_webhook(self, order_data, instance):
+        """
+        This method updates the existing order from the order webhook. New orders are not imported here, those are
+        imported together by the caller.
+        @param order_data: Dictionary of order's data.
+        @return: Order's data, when the order is new and should be imported.
+        """
+        _logger.info("UPDATE ORDER WEBHOOK call for order: %s", order_data.get("name"))
+        sale_order_obj = self.env["sale.order"]
+        fulfillment_status = order_data.get("fulfillment_status") or "unfulfilled"
+        if sale_order_obj.search_read([("shopify_instance_id", "=", instance.id),
+                                       ("shopify_order_id", "=", order_data.get("id")),
+                                       ("shopify_order_number", "=", order_data.get("order_number"))], ["id"]):
+            sale_order_obj.process_shopify_order_via_webhook(order_data, instance, True)
+        elif fulfillment_status in ["fulfilled", "unfulfilled", "partial"]:
+            order_data["fulfillment_status"] = fulfillment_status
+            return order_data
+        return False
+
+    def process_product_webhook(self, product_data, instance):
+        """
+        This method creates the product queue from the product update webhook and archives the product from the
+        product delete webhook.
+        @param product_data: Dictionary of product's data.
+        """
+        _logger.info("%s call for product: %s", self.route, product_data.get("title"))
+        shopify_template = self.env["shopify.product.template.ept"].with_context(active_test=False).search(
+            [("shopify_tmpl_id", "=", product_data.get("id")), ("shopify_instance_id", "=", instance.id)], limit=1)
+
+        if self.route == "shopify_odoo_webhook_for_product_update" and shopify_template or product_data.get(
+                "published_at"):
+            self.env["shopify.product.data.queue.ept"].create_shopify_product_queue_from_webhook(product_data,
+                                                                                                 instance)
+
+        if self.route == "shopify_odoo_webhook_for_product_delete" and shopify_template:
+            shopify_template.write({"active": False})
+        return True
@@ -15,6 +15,8 @@ from . pyactiveresource.collection import Collection
 
 class ShopifyConnection(pyactiveresource.connection.Connection):
     response = None
+    # Called with each response, e.g. to keep the API call limit of the shop of this connection
+    response_callback = None
 
     def __init__(self, site, user=None, password=None, timeout=None,
                  format=formats.JSONFormat):
@@ -27,6 +29,9 @@ class ShopifyConnection(pyactiveresource.connection.Connection):
         except pyactiveresource.connection.ConnectionError as err:
             self.response = err.response
             raise
+        finally:
+            if self.response_callback and self.response is not None:
+                self.response_callback(self.response)
         return self.response
 
 # Inherit from pyactiveresource's metaclass in order to use ShopifyConnection
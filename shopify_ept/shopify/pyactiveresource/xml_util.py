@@ -0,0 +1,274 @@
+# Copyright 2008 Google Inc. All Rights Reserved.
+
+"""XML format utilities for pyActiveResource.
+
+The module is imported lazily by util, as the resources are exchanged in
+JSON and the XML format is rarely needed.
+"""
+
+__author__ = 'Mark Roach (mrroach@google.com)'
+
+import base64
+import calendar
+import decimal
+import time
+import datetime
+import six
+from . import element_containers
+from .util import Error, singularize, underscore
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    from dateutil.parser import parse as date_parse
+except ImportError:
+    try:
+        from xml.utils import iso8601
+        def date_parse(time_string):
+            """Return a datetime object for the given ISO8601 string.
+
+            Args:
+                time_string: An ISO8601 timestamp.
+            Returns:
+                A datetime.datetime object.
+            """
+            return datetime.datetime.utcfromtimestamp(
+                    iso8601.parse(time_string))
+    except ImportError:
+        date_parse = None
+
+try:
+    from xml.etree import cElementTree as ET
+except ImportError:
+    try:
+        import cElementTree as ET
+    except ImportError:
+        from xml.etree import ElementTree as ET
+
+XML_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# An array of type-specific serializer methods which will be passed the value
+# and should return the element type and modified value.
+SERIALIZERS = [
+    {'type': bool,
+     'method': lambda value: ('boolean', six.text_type(value).lower())},
+    {'type': six.integer_types,
+     'method': lambda value: ('integer', six.text_type(value))}]
+if six.PY2:
+    SERIALIZERS.append({
+        'type': str,
+        'method': lambda value: (None, unicode(value, 'utf-8'))})
+else:
+    SERIALIZERS.append({
+        'type': bytes,
+        'method': lambda value: ('base64Binary', base64.b64encode(value).decode('ascii'))})
+
+DEFAULT_SERIALIZER = {
+    'type': object,
+    'method': lambda value: (None, six.text_type(value))}
+
+
+class FileObject(object):
+    """Represent a 'file' xml entity."""
+
+    def __init__(self, data, name='untitled',
+                 content_type='application/octet-stream'):
+        self.data = data
+        self.name = name
+        self.content_type = content_type
+
+
+def xml_pretty_format(element, level=0):
+    """Add PrettyPrint formatting to an ElementTree element.
+
+    Args:
+        element: An ElementTree element which is modified in-place.
+    Returns:
+        None
+    """
+    indent = '\n%s' % ('  ' * level)
+    if len(element):
+        if not element.text or not element.text.strip():
+            element.text = indent + '  '
+        for i, child in enumerate(element):
+            xml_pretty_format(child, level + 1)
+            if not child.tail or not child.tail.strip():
+                if i + 1 < len(element):
+                    child.tail = indent + "  "
+                else:
+                    child.tail = indent
+    else:
+        if level and (not element.tail or not element.tail.strip()):
+            element.tail = indent
+
+
+def serialize(value, element):
+    """Write a serialized value to an xml element.
+
+    Args:
+        value: The value to serialize.
+        element: An xml element to write to.
+    Returns:
+        None
+    """
+    if value is None:
+      element.set('nil', 'true')
+      return
+
+    for serializer in SERIALIZERS + [DEFAULT_SERIALIZER]:
+        if isinstance(value, serializer['type']):
+            element_type, element.text = serializer['method'](value)
+            if element_type:
+                element.set('type', element_type)
+            break
+
+
+def _to_xml_element(obj, root, dasherize):
+    root = dasherize and root.replace('_', '-') or root
+    root_element = ET.Element(root)
+    if isinstance(obj, list):
+        root_element.set('type', 'array')
+        for value in obj:
+            root_element.append(_to_xml_element(value, singularize(root), dasherize))
+    elif isinstance(obj, dict):
+        for key, value in six.iteritems(obj):
+            root_element.append(_to_xml_element(value, key, dasherize))
+    else:
+        serialize(obj, root_element)
+
+    return root_element
+
+
+def to_xml(obj, root='object', pretty=False, header=True, dasherize=True):
+    """Convert a dictionary or list to an XML string.
+
+    Args:
+        obj: The dictionary/list object to convert.
+        root: The name of the root xml element.
+        pretty: Whether to pretty-format the xml (default False).
+        header: Whether to include an xml header (default True).
+        dasherize: Whether to convert underscores to dashes in
+                   attribute names (default True).
+    Returns:
+        An xml string.
+    """
+    root_element = _to_xml_element(obj, root, dasherize)
+    if pretty:
+        xml_pretty_format(root_element)
+    xml_data = ET.tostring(root_element)
+    if header:
+        return XML_HEADER + xml_data
+    return xml_data
+
+
+def xml_to_dict(xmlobj, saveroot=True):
+    """Parse the xml into a dictionary of attributes.
+
+    Args:
+        xmlobj: An ElementTree element or an xml string.
+        saveroot: Keep the xml element names (ugly format)
+    Returns:
+        An ElementDict object or ElementList for multiple objects
+    """
+    if isinstance(xmlobj, (six.text_type, six.binary_type)):
+        # Allow for blank (usually HEAD) result on success
+        if xmlobj.isspace():
+            return {}
+        try:
+            element = ET.fromstring(xmlobj)
+        except Exception as err:
+            raise Error('Unable to parse xml data: %s' % err)
+    else:
+        element = xmlobj
+
+    element_type = element.get('type', '').lower()
+    if element_type == 'array':
+        element_list_type = element.tag.replace('-', '_')
+        return_list = element_containers.ElementList(element_list_type)
+        for child in element.getchildren():
+            return_list.append(xml_to_dict(child, saveroot=False))
+        if saveroot:
+            return element_containers.ElementDict(element_list_type,
+                                                  {element_list_type:
+                                                   return_list})
+        else:
+            return return_list
+    elif element.get('nil') == 'true':
+        return None
+    elif element_type in ('integer', 'datetime', 'date',
+                          'decimal', 'double', 'float') and not element.text:
+        return None
+    elif element_type == 'integer':
+        return int(element.text)
+    elif element_type == 'datetime':
+        if date_parse:
+            return date_parse(element.text)
+        else:
+            try:
+                timestamp = calendar.timegm(
+                        time.strptime(element.text, '%Y-%m-%dT%H:%M:%S+0000'))
+
+                return datetime.datetime.utcfromtimestamp(timestamp)
+            except ValueError as err:
+                raise Error('Unable to parse timestamp. Install dateutil'
+                            ' (http://labix.org/python-dateutil) or'
+                            ' pyxml (http://pyxml.sf.net/topics/)'
+                            ' for ISO8601 support.')
+    elif element_type == 'date':
+        time_tuple = time.strptime(element.text, '%Y-%m-%d')
+        return datetime.date(*time_tuple[:3])
+    elif element_type == 'decimal':
+        return decimal.Decimal(element.text)
+    elif element_type in ('float', 'double'):
+        return float(element.text)
+    elif element_type == 'boolean':
+        if not element.text:
+            return False
+        return element.text.strip() in ('true', '1')
+    elif element_type == 'yaml':
+        if not yaml:
+            raise ImportError('PyYaml is not installed: http://pyyaml.org/')
+        return yaml.safe_load(element.text)
+    elif element_type == 'base64binary':
+        return base64.decodestring(element.text.encode('ascii'))
+    elif element_type == 'file':
+        content_type = element.get('content_type',
+                                   'application/octet-stream')
+        filename = element.get('name', 'untitled')
+        return FileObject(element.text, filename, content_type)
+    elif element_type in ('symbol', 'string'):
+        if not element.text:
+            return ''
+        return element.text
+    elif element.getchildren():
+        # This is an element with children. The children might be simple
+        # values, or nested hashes.
+        if element_type:
+            attributes = element_containers.ElementDict(
+                underscore(element.get('type', '')), element.items())
+        else:
+            attributes = element_containers.ElementDict(singularize(
+                element.tag.replace('-', '_')), element.items())
+        for child in element.getchildren():
+            attribute = xml_to_dict(child, saveroot=False)
+            child_tag = child.tag.replace('-', '_')
+            # Handle multiple elements with the same tag name
+            if child_tag in attributes:
+                if isinstance(attributes[child_tag], list):
+                    attributes[child_tag].append(attribute)
+                else:
+                    attributes[child_tag] = [attributes[child_tag],
+                                             attribute]
+            else:
+                attributes[child_tag] = attribute
+        if saveroot:
+            return {element.tag.replace('-', '_'): attributes}
+        else:
+            return attributes
+    elif element.items():
+        return element_containers.ElementDict(element.tag.replace('-', '_'),
+                                              element.items())
+    else:
+        return element.text
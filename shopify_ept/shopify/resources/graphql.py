@@ -5,9 +5,9 @@ import json
 
 class GraphQL():
 
-    def __init__(self):
-        self.endpoint = (shopify.ShopifyResource.get_site() + "/graphql.json")
-        self.headers = shopify.ShopifyResource.get_headers()
+    def __init__(self, endpoint=None, headers=None):
+        self.endpoint = endpoint or (shopify.ShopifyResource.get_site() + "/graphql.json")
+        self.headers = shopify.ShopifyResource.get_headers() if headers is None else headers
 
     def merge_headers(self, *headers):
         merged_headers = {}
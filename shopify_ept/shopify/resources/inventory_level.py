@@ -5,6 +5,16 @@ import json
 
 class InventoryLevel(ShopifyResource):
 
+    # Maximum quantities in one inventorySetQuantities mutation.
+    MAX_SET_QUANTITIES = 250
+    SET_QUANTITIES_MUTATION = """
+        mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
+          inventorySetQuantities(input: $input) {
+            inventoryAdjustmentGroup { id }
+            userErrors { field message }
+          }
+        }"""
+
     def __repr__(self):
         return '%s(inventory_item_id=%s, location_id=%s)' % (self._singular, self.inventory_item_id, self.location_id)
 
@@ -47,6 +57,51 @@ class InventoryLevel(ShopifyResource):
         resource = cls.post('set', body=json.dumps(body).encode())
         return InventoryLevel(InventoryLevel.format.decode(resource.body))
 
+    @classmethod
+    def prepare_set_quantities(cls, location_id, quantities, reason="correction"):
+        """Prepare the GraphQL mutation, which sets the available quantities of many inventory items at a location.
+
+        Args:
+            location_id: Id of the location.
+            quantities: List of (inventory_item_id, available) tuples, at most MAX_SET_QUANTITIES.
+            reason: Reason of the change shown in Shopify.
+        Returns:
+            The mutation and its variables.
+        """
+        variables = {"input": {
+            "name": "available",
+            "reason": reason,
+            "ignoreCompareQuantity": True,
+            "quantities": [{"inventoryItemId": "gid://shopify/InventoryItem/%s" % inventory_item_id,
+                            "locationId": "gid://shopify/Location/%s" % location_id,
+                            "quantity": int(available)} for inventory_item_id, available in quantities]}}
+        return cls.SET_QUANTITIES_MUTATION, variables
+
+    @classmethod
+    def parse_set_quantities_errors(cls, response, count):
+        """Map the errors of the inventorySetQuantities response to the quantities of the request.
+
+        Args:
+            response: Decoded GraphQL response.
+            count: Number of quantities in the request.
+        Returns:
+            A dictionary of the index of the quantity and its error. The index is None for the errors which are
+            not about one quantity, like a throttled request.
+        """
+        errors = {}
+        for error in response.get("errors") or []:
+            errors.setdefault(None, error.get("message"))
+        result = (response.get("data") or {}).get("inventorySetQuantities") or {}
+        for user_error in result.get("userErrors") or []:
+            field = user_error.get("field") or []
+            index = None
+            if len(field) > 2 and field[1] == "quantities" and str(field[2]).isdigit() and int(field[2]) < count:
+                index = int(field[2])
+            errors.setdefault(index, user_error.get("message"))
+        if not errors and not result:
+            errors[None] = "No response from Shopify."
+        return errors
+
     def is_new(self):
         return False
 
@@ -1,4 +1,5 @@
 import time
+import base64
 import hmac
 import json
 from hashlib import sha256
@@ -119,7 +120,20 @@ class Session(object):
 
         hmac_calculated = cls.calculate_hmac(params).encode('utf-8')
         hmac_to_verify = params['hmac'].encode('utf-8')
+        return cls.compare_hmac(hmac_calculated, hmac_to_verify)
 
+    @classmethod
+    def validate_webhook_hmac(cls, secret, body, hmac_to_verify):
+        """
+        Validate the X-Shopify-Hmac-Sha256 header of a webhook against the raw request body.
+        """
+        if not secret or not hmac_to_verify:
+            return False
+        hmac_calculated = base64.b64encode(hmac.new(secret.encode('utf-8'), body, sha256).digest())
+        return cls.compare_hmac(hmac_calculated, hmac_to_verify.encode('utf-8'))
+
+    @classmethod
+    def compare_hmac(cls, hmac_calculated, hmac_to_verify):
         # Try to use compare_digest() to reduce vulnerability to timing attacks.
         # If it's not available, just fall back to regular string comparison.
         try:
@@ -14,7 +14,7 @@ from odoo.tools.misc import split_every
 
 from odoo import models, fields, api, _
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
+from ..models.order_data_queue_line_ept import QUEUE_LANE_WEIGHTS
 
 _logger = logging.getLogger("Shopify Operations")
 
@@ -81,6 +81,12 @@ class ShopifyProcessImportExport(models.TransientModel):
                                                            "while selected operation cron is running in backend")
     import_products_based_on_date = fields.Selection([("create_date", "Create Date"), ("update_date", "Update Date")],
                                                      default="update_date", string="Import Based On")
+    is_order_backfill = fields.Boolean(string="Backfill Mode",
+                                       help="If checked, the dates are split into windows, which are fetched "
+                                            "concurrently in the background. An interrupted backfill resumes from "
+                                            "its saved windows.")
+    backfill_window_count = fields.Integer(string="Concurrent Windows", default=4,
+                                           help="Number of windows fetched at a time in backfill mode.")
 
     def shopify_execute(self):
         """This method used to execute the operation as per given in wizard.
@@ -121,6 +127,13 @@ class ShopifyProcessImportExport(models.TransientModel):
                 action_name = "shopify_ept.action_shopify_synced_customer_data"
                 form_view_name = "shopify_ept.shopify_synced_customer_data_form_view_ept"
 
+        elif self.is_order_backfill and self.shopify_operation in ["import_unshipped_orders",
+                                                                   "import_shipped_orders"]:
+            backfill = self.shopify_order_backfill()
+            queue_ids = backfill.ids
+            action_name = "shopify_ept.action_shopify_order_backfill_ept"
+            form_view_name = "shopify_ept.view_shopify_order_backfill_ept_form"
+
         elif self.shopify_operation == "import_unshipped_orders":
             order_date_queue_obj.shopify_create_order_data_queues(instance, self.orders_from_date,
                                                                   self.orders_to_date,
@@ -185,6 +198,23 @@ class ShopifyProcessImportExport(models.TransientModel):
             "tag": "reload",
         }
 
+    def shopify_order_backfill(self):
+        """
+        This method creates the backfill of the given dates, which runs in the background. The dates are split into
+        windows, which are fetched concurrently and queued.
+        @return: Record of backfill.
+        """
+        if self.backfill_window_count < 1:
+            raise UserError(_("Concurrent windows must be at least 1."))
+        if self.orders_to_date <= self.orders_from_date:
+            raise UserError(_("The from date must precede the to date."))
+        order_type = "shipped" if self.shopify_operation == "import_shipped_orders" else "unshipped"
+        return self.env["shopify.order.backfill.ept"].create_order_backfill(self.shopify_instance_id,
+                                                                            self.orders_from_date,
+                                                                            self.orders_to_date,
+                                                                            self.backfill_window_count,
+                                                                            order_type)
+
     def manual_export_product_to_shopify(self):
         """ This method is used to call child method for export products from shopify layer products to Shopify store.
             It calls from the Shopify layer product screen.
@@ -282,20 +312,21 @@ class ShopifyProcessImportExport(models.TransientModel):
         @change: Maulik Barad on Date 09-Sep-2020.
         """
         customer_queues_ids = []
+        instance = self.shopify_instance_id
 
-        self.shopify_instance_id.connect_in_shopify()
-        if not self.shopify_instance_id.shopify_last_date_customer_import:
-            customer_ids = shopify.Customer().find(limit=250)
+        instance.connect_in_shopify()
+        # The customers are requested by id, so an interrupted import resumes after the last imported customer.
+        filters = {"since_id": 0}
+        if instance.shopify_last_date_customer_import:
+            filters.update({"updated_at_min": instance.shopify_last_date_customer_import})
+        checkpoint = self.env["shopify.import.checkpoint.ept"].get_import_checkpoint(instance, "customer", "import",
+                                                                                    filters)
+        import_start_date = checkpoint.create_date
+        for customers in checkpoint.shopify_checkpoint_pages(shopify.Customer):
+            customer_queues_ids += self.create_customer_data_queues(customers)
+        if customer_queues_ids:
+            instance.shopify_last_date_customer_import = import_start_date
         else:
-            customer_ids = shopify.Customer().find(
-                updated_at_min=self.shopify_instance_id.shopify_last_date_customer_import, limit=250)
-        if customer_ids:
-            customer_queues_ids = self.create_customer_data_queues(customer_ids)
-            if len(customer_ids) == 250:
-                customer_queues_ids += self.shopify_list_all_customer(customer_ids)
-
-            self.shopify_instance_id.shopify_last_date_customer_import = datetime.now()
-        if not customer_ids:
             _logger.info("Customers not found while the import customers from Shopify")
         return customer_queues_ids
 
@@ -323,6 +354,8 @@ class ShopifyProcessImportExport(models.TransientModel):
                 _logger.info(message)
 
                 customer_queue_list.append(customer_queue.id)
+            self.shopify_instance_id.enqueue_queue_job_ept(customer_data_queue_obj.browse(customer_queue_list),
+                                                           dict(QUEUE_LANE_WEIGHTS)["manual"])
             self._cr.commit()
         return customer_queue_list
 
@@ -347,40 +380,9 @@ class ShopifyProcessImportExport(models.TransientModel):
         customer_queue_id.synced_customer_queue_line_ids.shopify_customer_data_queue_line_create(res, customer_queue_id)
         if len(customer_queue_id.synced_customer_queue_line_ids) == 50:
             customer_queue_id.synced_customer_queue_line_ids.sync_shopify_customer_into_odoo()
+        instance.enqueue_queue_job_ept(customer_queue_id, dict(QUEUE_LANE_WEIGHTS)["webhook"])
         return True
 
-    def shopify_list_all_customer(self, result):
-        """
-        This method used to call the page wise data import for customers from Shopify to Odoo.
-        @author: Angel Patel @Emipro Technologies Pvt. Ltd on date 14/10/2019.
-        :Task ID: 157065
-        Modify by Haresh Mori on date 26/12/2019, Taken Changes for the pagination and API version.
-        """
-        catch = ""
-        customer_queue_list = []
-        while result:
-            page_info = ""
-            link = shopify.ShopifyResource.connection.response.headers.get('Link')
-            if not link or not isinstance(link, str):
-                return customer_queue_list
-            for page_link in link.split(','):
-                if page_link.find('next') > 0:
-                    page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
-                    try:
-                        result = shopify.Customer().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                result = shopify.Customer().find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        customer_queue_list += self.create_customer_data_queues(result)
-            if catch == page_info:
-                break
-        return customer_queue_list
-
     @api.model
     def update_stock_in_shopify(self, ctx={}):
         """
@@ -390,6 +392,7 @@ class ShopifyProcessImportExport(models.TransientModel):
         shopify_instance_obj = self.env['shopify.instance.ept']
         product_obj = self.env['product.product']
         shopify_product_obj = self.env['shopify.product.product.ept']
+        stock_change_obj = self.env['product.stock.change.ept']
 
         if self.shopify_instance_id:
             instance = self.shopify_instance_id
@@ -403,12 +406,24 @@ class ShopifyProcessImportExport(models.TransientModel):
         if self.export_stock_from:
             last_update_date = self.export_stock_from
             _logger.info("Exporting Stock from Operations wizard for instance - %s", instance.name)
+            products = product_obj.get_products_based_on_movement_date_ept(last_update_date,
+                                                                           instance.shopify_company_id)
         else:
+            # The cron exports only the products of which the stock is changed after the last export.
             last_update_date = instance.shopify_last_date_update_stock or datetime.now() - timedelta(30)
             _logger.info("Exporting Stock by Cron for instance - %s", instance.name)
+            export_start_date = datetime.now()
+            products, change_ids = stock_change_obj.get_changed_products_ept(instance.get_stock_change_key_ept(),
+                                                                             last_update_date,
+                                                                             instance.shopify_company_id)
+            if products:
+                shopify_product_obj.with_context(is_process_from_stock_change=True).export_stock_in_shopify(
+                    instance, products)
+            # The products, whose export failed, are added again as changed, so only the exported changes are removed.
+            stock_change_obj.consume_stock_changes_ept(change_ids)
+            instance.shopify_last_date_update_stock = export_start_date
+            return True
 
-        products = product_obj.get_products_based_on_movement_date_ept(last_update_date,
-                                                                       instance.shopify_company_id)
         if products:
             shopify_products = shopify_product_obj.export_stock_in_shopify(instance, products)
             if shopify_products:
@@ -233,6 +233,13 @@ class ResConfigSettings(models.TransientModel):
     create_shopify_customers_webhook = fields.Boolean("Manage Shopify Customers via Webhooks",
                                                       help="True : It will create all customer related webhooks.\n"
                                                            "False : All customer related webhooks will be deactivated.")
+    shopify_queue_process_concurrency = fields.Integer("Queue Process Concurrency", default=0,
+                                                       help="Maximum number of queue crons processing the queues "
+                                                            "of this instance at the same time. Zero means no "
+                                                            "limit.")
+    shopify_webhook_coalesce_seconds = fields.Integer("Webhook Coalesce Window (Seconds)", default=10,
+                                                      help="Webhooks of the same record received within these "
+                                                           "seconds are processed once with the latest data.")
     create_shopify_orders_webhook = fields.Boolean("Manage Shopify Orders via Webhooks",
                                                    help="True : It will create all order related webhooks.\n"
                                                         "False : All order related webhooks will be deactivated.")
@@ -310,6 +317,8 @@ class ResConfigSettings(models.TransientModel):
             self.create_shopify_products_webhook = instance.create_shopify_products_webhook
             self.create_shopify_customers_webhook = instance.create_shopify_customers_webhook
             self.create_shopify_orders_webhook = instance.create_shopify_orders_webhook
+            self.shopify_webhook_coalesce_seconds = instance.webhook_coalesce_seconds
+            self.shopify_queue_process_concurrency = instance.queue_process_concurrency
 
             self.shopify_default_pos_customer_id = instance.shopify_default_pos_customer_id
             self.last_date_order_import = instance.last_date_order_import or False
@@ -357,6 +366,8 @@ class ResConfigSettings(models.TransientModel):
             values["create_shopify_products_webhook"] = self.create_shopify_products_webhook
             values["create_shopify_customers_webhook"] = self.create_shopify_customers_webhook
             values["create_shopify_orders_webhook"] = self.create_shopify_orders_webhook
+            values["webhook_coalesce_seconds"] = self.shopify_webhook_coalesce_seconds
+            values["queue_process_concurrency"] = self.shopify_queue_process_concurrency
             values["shopify_default_pos_customer_id"] = self.shopify_default_pos_customer_id.id
             values["last_date_order_import"] = self.last_date_order_import
             values["shopify_last_date_customer_import"] = self.shopify_last_date_customer_import